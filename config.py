@@ -1,6 +1,6 @@
 import os
-import sys
-from pydantic.dataclasses import dataclass
+import logging
+from dataclasses import dataclass
 from dotenv import load_dotenv
 
 # 版本号
@@ -12,23 +12,25 @@ load_dotenv()
 # 检查是否有 Notion API 密钥
 notion_api_key = os.getenv("NOTION_API_KEY")
 if not notion_api_key:
-    print("错误: 没有找到 Notion API 密钥，请在 .env 文件中设置 NOTION_API_KEY")
-    print("当前工作目录:", os.getcwd())
-    print(".env 文件内容:")
-    try:
-        with open(".env", "r") as f:
-            print(f.read())
-    except Exception as e:
-        print(f"无法读取 .env 文件: {e}")
+    logging.getLogger(__name__).error("没有找到 Notion API 密钥，请在 .env 文件或环境变量中设置 NOTION_API_KEY")
 
 # 获取 API 密钥
 api_key = os.getenv("API_KEY", "")
 
+# 日志级别
+log_level = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# 磁盘缓存目录（为空时仅使用内存缓存）
+cache_dir = os.getenv("CACHE_DIR", "")
+
+# 服务器工作进程数
+api_workers = int(os.getenv("API_WORKERS", "1"))
+
 # AWS S3 凭据
 s3_access_key_id = os.getenv("S3_ACCESS_KEY_ID", "")
 s3_secret_access_key = os.getenv("S3_SECRET_ACCESS_KEY", "")
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Settings:
     # 版本号
     VERSION: str = VERSION
@@ -40,6 +42,10 @@ class Settings:
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8000
     API_KEY: str = api_key  # API 访问密钥
+    API_WORKERS: int = api_workers  # 工作进程数（每个进程有独立的缓存）
+
+    # 日志设置
+    LOG_LEVEL: str = log_level  # 日志级别（DEBUG 时输出详细的列表信息）
 
     # AWS S3 凭据
     S3_ACCESS_KEY_ID: str = s3_access_key_id  # AWS S3 访问密钥 ID
@@ -50,9 +56,13 @@ class Settings:
 
     # 缓存设置
     CACHE_EXPIRATION: int = 300  # 5 分钟（秒）
+    CACHE_MAX_ENTRIES: int = 4096  # Notion API 缓存的最大条目数
+    CACHE_REVALIDATE_WINDOW: int = 1800  # 子项列表按编辑时间校验后可继续沿用的时长（秒），需短于 Notion 文件 URL 的有效期
+    CACHE_DIR: str = cache_dir  # 磁盘缓存目录，重启后缓存仍然有效（需要 diskcache）
 
     # 性能设置
-    MAX_CONCURRENT_REQUESTS: int = 20  # 并发请求数
+    MAX_CONCURRENT_REQUESTS: int = 5  # 同时进行的 Notion API 请求数（每秒请求数由 NOTION_REQUESTS_PER_SECOND 单独限制）
+    NOTION_REQUESTS_PER_SECOND: float = 3  # Notion API 每秒请求数上限
     REQUEST_TIMEOUT: int = 60  # 请求超时时间（秒）
     LONG_POLLING_TIMEOUT: int = 300  # 长轮询超时时间（秒）
 
@@ -1,25 +1,35 @@
-import os
-import json
-import xml.etree.ElementTree as ET
-from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
-import urllib.parse
-
-from fastapi import FastAPI, HTTPException, Query, Request, Response, Header, Depends
-from fastapi.responses import JSONResponse, RedirectResponse
+import re
+import logging
+import asyncio
+import time
+from collections import OrderedDict
+import hashlib
+import hmac
+from xml.sax.saxutils import escape as xml_escape
+from typing import Dict, List, Optional, Any, Tuple
+from datetime import datetime
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response, Depends
+from fastapi.responses import ORJSONResponse, RedirectResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security.api_key import APIKeyHeader
 # from auth import s3_auth_required  # 暂时移除S3验证
 
 from config import settings
-from models import NotionIdType, NotionObject, NotionFile, NotionFolder, S3ListObjectsResponse, S3Error, S3Object, S3CommonPrefix
+from models import NotionIdType, NotionFile, S3ListObjectsResponse, S3CommonPrefix
 from notion_api_client import NotionAPI
-from s3_adapter import S3Adapter
-from utils import detect_notion_id_type, decode_url_encoding, format_datetime_for_browser, generate_etag
+from s3_adapter import S3Adapter, render_contents_row
+from utils import detect_notion_id_type, decode_url_encoding, format_datetime_for_browser
+
+# 配置日志，级别由 LOG_LEVEL 控制
+logging.basicConfig(level=settings.LOG_LEVEL, format="%(message)s")
+logger = logging.getLogger("notion_s3_api")
 
 app = FastAPI(
     title="Notion S3 API",
-    version=settings.VERSION
+    version=settings.VERSION,
+    default_response_class=ORJSONResponse  # 使用 orjson 加速 JSON 序列化
 )
 
 # 添加 CORS 中间件
@@ -34,20 +44,30 @@ app.add_middleware(
 # 增加超时设置
 from starlette.middleware.base import BaseHTTPMiddleware
 
+# 无需超时控制的轻量路径（首页与文档）
+_NO_TIMEOUT_PATHS = frozenset(("/", "/docs", "/redoc", "/openapi.json", "/docs/oauth2-redirect"))
+
+# Python 3.11+ 的 asyncio.timeout 只重设截止时间，无需像 wait_for 那样额外包装任务
+_asyncio_timeout = getattr(asyncio, "timeout", None)
+
+
 class TimeoutMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request, call_next):
+        path = request.url.path
+        if path in _NO_TIMEOUT_PATHS:
+            return await call_next(request)
+
+        # 对于 S3 请求，使用更长的超时时间
+        timeout = settings.REQUEST_TIMEOUT if path.startswith("/api/") else settings.LONG_POLLING_TIMEOUT
+
         # 增加超时处理
-        import asyncio
         try:
-            # 对于 S3 请求，使用更长的超时时间
-            if request.url.path.startswith("/api/"):
-                timeout = settings.REQUEST_TIMEOUT
-            else:
-                timeout = settings.LONG_POLLING_TIMEOUT
-
+            if _asyncio_timeout is not None:
+                async with _asyncio_timeout(timeout):
+                    return await call_next(request)
             return await asyncio.wait_for(call_next(request), timeout=timeout)
         except asyncio.TimeoutError:
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=504,
                 content={
                     "detail": "请求超时，请尝试使用更小的 Notion ID 或者直接访问子页面"
@@ -59,15 +79,30 @@ app.add_middleware(TimeoutMiddleware)
 # 初始化 Notion API 客户端
 notion_api = NotionAPI()
 
-# 初始化 S3 适配器
-s3_adapter = S3Adapter()
+
+@app.on_event("shutdown")
+async def close_notion_client():
+    """取消未完成的处理任务（包括后台刷新）并关闭 Notion 客户端的连接池"""
+    tasks = list(_processing_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await notion_api.aclose()
+
+# 每个存储桶（Notion ID）使用独立的 S3 适配器，互不覆盖
 
 # API 密钥验证
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
+# 启动时确定是否需要密钥，并编码一次供常量时间比较使用
+_API_KEY_REQUIRED = bool(settings.API_KEY)
+_API_KEY_BYTES = settings.API_KEY.encode("utf-8") if _API_KEY_REQUIRED else b""
+
 async def verify_api_key(api_key: str = Depends(api_key_header)):
     """验证 API 密钥"""
-    if not settings.API_KEY or api_key == settings.API_KEY:
+    if not _API_KEY_REQUIRED:
+        return api_key
+    if api_key and hmac.compare_digest(api_key.encode("utf-8"), _API_KEY_BYTES):
         return api_key
     raise HTTPException(
         status_code=403,
@@ -75,38 +110,179 @@ async def verify_api_key(api_key: str = Depends(api_key_header)):
     )
 
 
-async def get_notion_id_from_request(request: Request) -> str:
-    """从请求中获取 Notion ID"""
-    notion_id = request.query_params.get("id")
-
-    if not notion_id:
-        raise HTTPException(status_code=400, detail="需要提供 Notion ID")
-
-    return notion_id
-
-
 @app.get("/")
 async def root():
     """根端点 - 重定向到文档"""
-    return {"message": "Notion S3 API", "docs_url": "/docs"}
+    return {"message": "Notion S3 API", "docs_url": "/docs", "cache": notion_api.cache_stats()}
+
+
+_STATUS_PREFIXES = {
+    "step": "\033[1;34m[STEP]\033[0m ",
+    "success": "\033[1;32m[SUCCESS]\033[0m ",
+    "error": "\033[1;31m[ERROR]\033[0m ",
+    "info": "\033[1;36m[INFO]\033[0m ",
+}
 
 
 def print_status(message, is_step=False, is_success=False, is_error=False):
-    """美化输出状态信息"""
-    prefix = ""
-    if is_step:
-        prefix = "\033[1;34m[STEP]\033[0m "
+    """美化输出状态信息（通过 logging 输出，未启用的级别不会产生 I/O）"""
+    if is_error:
+        logger.error("%s%s", _STATUS_PREFIXES["error"], message)
+    elif is_step:
+        logger.info("%s%s", _STATUS_PREFIXES["step"], message)
     elif is_success:
-        prefix = "\033[1;32m[SUCCESS]\033[0m "
-    elif is_error:
-        prefix = "\033[1;31m[ERROR]\033[0m "
+        logger.info("%s%s", _STATUS_PREFIXES["success"], message)
     else:
-        prefix = "\033[1;36m[INFO]\033[0m "
+        logger.info("%s%s", _STATUS_PREFIXES["info"], message)
+
+
+# S3 错误响应模板，所有错误路径共用
+_ERROR_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<Error><Code>%(Code)s</Code><Message>%(Message)s</Message>'
+    '<Resource>%(Resource)s</Resource><RequestId>%(RequestId)s</RequestId></Error>'
+)
+
+
+def _s3_error_xml(code: str, message: str, resource: str) -> bytes:
+    """格式化 S3 错误响应 XML"""
+    return (_ERROR_TEMPLATE % {
+        "Code": xml_escape(code),
+        "Message": xml_escape(message),
+        "Resource": xml_escape(resource),
+        "RequestId": "notion-s3-api"
+    }).encode("utf-8")
+
+
+def _s3_error_response(code: str, message: str, resource: str, status: int = 404) -> Response:
+    """返回 S3 格式的错误响应"""
+    return Response(content=_s3_error_xml(code, message, resource), media_type="application/xml", status_code=status)
+
+
+# ListObjects 响应缓存: (bucket, prefix, delimiter, max_keys) -> (过期时间, ETag, XML)
+_LIST_RESPONSE_CACHE_SIZE = 128
+_list_response_cache: Dict[Tuple[str, str, str, int], Tuple[float, str, bytes]] = {}
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """检查 If-None-Match 头部是否匹配 ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or etag.strip('"') in candidates
+
+
+def _list_response(request: Request, etag: str, xml_str: bytes, expires_at: float) -> Response:
+    """返回列表 XML，或在客户端缓存仍有效时返回 304"""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max(int(expires_at - time.monotonic()), 0)}"
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=xml_str, media_type="application/xml", headers=headers)
+
+
+# 用于过滤 ID 形式的对象键
+_ID_KEY_RE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+def _build_list_xml(response: S3ListObjectsResponse, content_rows: Dict[str, str]) -> bytes:
+    """构建 S3 ListBucketResult XML
+
+    直接拼接字符串片段，不构建中间的 ElementTree 节点；
+    适配器中已预先渲染的对象直接复用其 XML 片段
+    """
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        "<ListBucketResult>",
+        f"<Name>{xml_escape(response.Name)}</Name>",
+        f"<Prefix>{xml_escape(response.Prefix)}</Prefix>",
+        f"<Marker>{xml_escape(response.Marker)}</Marker>",
+        f"<MaxKeys>{response.MaxKeys}</MaxKeys>",
+        f"<IsTruncated>{str(response.IsTruncated).lower()}</IsTruncated>",
+    ]
+
+    # 添加内容（优先使用预先渲染的片段）
+    parts.extend([
+        content_rows.get(obj.Key) or render_contents_row(obj)
+        for obj in response.Contents
+    ])
+
+    # 添加公共前缀（文件夹）
+    parts.extend([
+        f"<CommonPrefixes><Prefix>{xml_escape(prefix_obj.Prefix)}</Prefix></CommonPrefixes>"
+        for prefix_obj in response.CommonPrefixes
+    ])
+
+    parts.append("</ListBucketResult>")
+    return "".join(parts).encode("utf-8")
+
+
+# 正在进行的 Notion 数据处理任务，相同 ID 的并发请求共享同一个任务
+_processing_tasks: Dict[str, asyncio.Task] = {}
+
+# 存储桶缓存: 格式化 ID -> (过期时间, 可继续使用的截止时间, 处理结果, S3 适配器)，按最近使用排序
+_MAX_CACHED_BUCKETS = 16
+_bucket_cache: "OrderedDict[str, Tuple[float, float, Dict[str, Any], S3Adapter]]" = OrderedDict()
+
+
+async def process_notion_data(notion_id: str) -> Tuple[Dict[str, Any], S3Adapter]:
+    """处理 Notion 数据并返回该存储桶的 S3 适配器
+
+    结果在缓存有效期内直接复用；过期后只要文件 URL 仍有效，先返回旧结果并在后台刷新。
+    同一 Notion ID 的并发请求只触发一次完整的抓取，其余请求等待同一结果
+    """
+    _, cache_key = detect_notion_id_type(notion_id)
+
+    cached = _bucket_cache.get(cache_key)
+    if cached:
+        now = time.monotonic()
+        fresh_until, stale_until, result, adapter = cached
+        if now < stale_until:
+            _bucket_cache.move_to_end(cache_key)
+            if now >= fresh_until:
+                _start_processing(notion_id, cache_key)
+            return result, adapter
+
+    # shield 防止单个请求超时或断开时取消其他请求共享的任务
+    return await asyncio.shield(_start_processing(notion_id, cache_key))
 
-    print(f"{prefix}{message}")
 
-async def process_notion_data(notion_id: str):
-    """处理 Notion 数据并更新 S3 适配器"""
+def _start_processing(notion_id: str, cache_key: str) -> asyncio.Task:
+    """返回该 ID 正在进行的处理任务，没有时新建一个"""
+    task = _processing_tasks.get(cache_key)
+    if task is None:
+        task = asyncio.create_task(_process_notion_data(notion_id, cache_key))
+        _processing_tasks[cache_key] = task
+
+        def _discard(t: asyncio.Task) -> None:
+            if _processing_tasks.get(cache_key) is t:
+                del _processing_tasks[cache_key]
+            # 后台刷新没有等待者，取出异常避免未处理异常的警告
+            if not t.cancelled():
+                t.exception()
+
+        task.add_done_callback(_discard)
+
+    return task
+
+
+def _notion_data_ttl(notion_files: List[NotionFile]) -> Tuple[float, float]:
+    """计算缓存有效期及过期后可继续使用的时长，均不超过最早过期的文件 URL"""
+    ttl = float(settings.CACHE_EXPIRATION)
+    stale_ttl = 2 * ttl
+    expirations = [file.expiration_time for file in notion_files if file.expiration_time]
+    if expirations:
+        remaining = (min(expirations) - datetime.now()).total_seconds()
+        ttl = min(ttl, remaining)
+        stale_ttl = remaining
+    return ttl, stale_ttl
+
+
+async def _process_notion_data(notion_id: str, cache_key: str) -> Tuple[Dict[str, Any], S3Adapter]:
+    """处理 Notion 数据并构建 S3 适配器"""
+    # 处理期间发生过缓存失效时，结果可能已过时，只返回不缓存
+    generation = notion_api.generation
     try:
         print_status(f"\n=== 开始处理 Notion ID: {notion_id} ===\n", is_step=True)
 
@@ -133,29 +309,33 @@ async def process_notion_data(notion_id: str):
                 # 使用原始 ID
                 formatted_id = notion_id
 
-        # 直接获取文件，而不是先获取子页面
-        print_status("\n正在获取文件...", is_step=True)
-        notion_files = await notion_api.get_all_files(formatted_id)
+        # 并行获取文件、子页面和文件夹结构，三者互不依赖
+        print_status(f"\n正在获取文件、子页面和文件夹结构: {formatted_id}...", is_step=True)
+        tasks = [
+            asyncio.ensure_future(notion_api.get_all_files(formatted_id)),
+            asyncio.ensure_future(notion_api.get_all_subpages_recursive(formatted_id)),
+            asyncio.ensure_future(notion_api.create_folder_structure(formatted_id)),
+        ]
+        try:
+            notion_files, notion_objects, notion_folders = await asyncio.gather(*tasks)
+        except BaseException:
+            # 任一抓取失败或被取消时，取消其余抓取，避免它们在后台继续占用请求名额
+            for task in tasks:
+                task.cancel()
+            raise
         print_status(f"找到 {len(notion_files)} 个文件", is_success=True)
-
-        # 获取所有子页面
-        print_status(f"\n正在获取子页面: {formatted_id}...", is_step=True)
-        notion_objects = await notion_api.get_all_subpages_recursive(formatted_id)
         print_status(f"找到 {len(notion_objects)} 个对象", is_success=True)
-
-        # 创建文件夹结构
-        print_status("\n正在创建文件夹结构...", is_step=True)
-        notion_folders = await notion_api.create_folder_structure(formatted_id)
         print_status(f"创建了 {len(notion_folders)} 个文件夹", is_success=True)
 
         # 更新 S3 适配器
         print_status("\n正在更新 S3 适配器...", is_step=True)
-        await s3_adapter.update_from_notion_data(notion_objects, notion_folders, notion_files)
+        adapter = S3Adapter()
+        await adapter.update_from_notion_data(notion_objects, notion_folders, notion_files)
         print_status("更新 S3 适配器完成", is_success=True)
 
         print_status(f"\n=== 处理完成 ===\n", is_success=True)
 
-        return {
+        result = {
             "id": formatted_id,
             "type": id_type,
             "objects_count": len(notion_objects),
@@ -164,6 +344,17 @@ async def process_notion_data(notion_id: str):
             "status": "success",
             "version": settings.VERSION
         }
+
+        # 缓存结果，有效期内的请求无需重新抓取 Notion
+        ttl, stale_ttl = _notion_data_ttl(notion_files)
+        if ttl > 0 and generation == notion_api.generation:
+            now = time.monotonic()
+            _bucket_cache[cache_key] = (now + ttl, now + stale_ttl, result, adapter)
+            _bucket_cache.move_to_end(cache_key)
+            while len(_bucket_cache) > _MAX_CACHED_BUCKETS:
+                _bucket_cache.popitem(last=False)
+
+        return result, adapter
     except HTTPException:
         # 重新抛出 HTTP 异常
         raise
@@ -180,35 +371,23 @@ async def process_notion_data(notion_id: str):
 async def get_notion_content(notion_id: str):
     """获取 Notion 内容并返回 API 格式的下载链接"""
     # 处理 Notion 数据
-    result = await process_notion_data(notion_id)
-
-    # 获取所有文件
-    files = []
-    for file_id, file_data in s3_adapter.files.items():
-        file = NotionFile(**file_data)
-
-        # 找到父文件夹路径
-        path = ""
-        parent_id = file.parent_id
-
-        while parent_id and parent_id in s3_adapter.folders:
-            folder = NotionFolder(**s3_adapter.folders[parent_id])
-            path = f"{folder.name}/{path}"
-            parent_id = folder.parent_id
-
-        # 添加过期时间
-        expiration_time = file.expiration_time
-        expiration_str = format_datetime_for_browser(expiration_time) if expiration_time else None
-
-        files.append({
-            "id": file.id,
-            "name": file.name,
-            "path": path + file.name,
-            "type": file.type,
-            "size": file.size,
-            "url": file.url,
-            "expiration_time": expiration_str
-        })
+    result, adapter = await process_notion_data(notion_id)
+
+    # 获取所有文件，父文件夹的完整路径已在更新适配器时预先计算
+    folders = adapter.folders
+    fmt = format_datetime_for_browser
+    files = [
+        {
+            "id": f.id,
+            "name": f.name,
+            "path": folders[f.parent_id]["full_path"] + f.name if f.parent_id in folders else f.name,
+            "type": f.type,
+            "size": f.size,
+            "url": f.url,
+            "expiration_time": fmt(f.expiration_time) if f.expiration_time else None
+        }
+        for f in adapter.files.values()
+    ]
 
     return {
         "id": result["id"],
@@ -218,147 +397,127 @@ async def get_notion_content(notion_id: str):
     }
 
 
+@app.delete("/api/{notion_id}/cache", dependencies=[Depends(verify_api_key)])
+async def invalidate_notion_cache(notion_id: str):
+    """使指定 Notion 对象及其子页面的缓存失效，下次请求时重新抓取"""
+    _, cache_key = detect_notion_id_type(notion_id)
+    affected = notion_api.invalidate(cache_key)
+
+    # 同时丢弃包含该对象的存储桶（对象本身或其上级对象）已构建的适配器和列表响应；
+    # 进行中的处理任务继续完成，但之后的请求不再等待它，而是重新抓取
+    for bucket_id in [k for k in _bucket_cache if k in affected]:
+        del _bucket_cache[bucket_id]
+    for bucket_id in [k for k in _processing_tasks if k in affected]:
+        del _processing_tasks[bucket_id]
+    for list_key in [k for k in _list_response_cache if detect_notion_id_type(k[0])[1] in affected]:
+        del _list_response_cache[list_key]
+
+    return {"id": cache_key, "invalidated": len(affected)}
+
+
 # S3 兼容 API 端点
 
 @app.get("/{bucket}")
 async def list_bucket_objects(
+    request: Request,
     bucket: str,
     prefix: Optional[str] = Query("", alias="prefix"),
     delimiter: Optional[str] = Query("", alias="delimiter"),
     max_keys: Optional[int] = Query(1000, alias="max-keys")
 ):
     """列出存储桶中的对象（S3 兼容）"""
+    # 相同查询在缓存有效期内直接返回已生成的 XML
+    cache_key = (bucket, prefix, delimiter, max_keys)
+    cached = _list_response_cache.get(cache_key)
+    if cached and time.monotonic() < cached[0]:
+        expires_at, etag, xml_str = cached
+        return _list_response(request, etag, xml_str, expires_at)
+
     # 处理 Notion 数据（存储桶名称就是 Notion ID）
+    generation = notion_api.generation
     try:
-        await process_notion_data(bucket)
+        _, adapter = await process_notion_data(bucket)
     except Exception as e:
         # 返回 S3 格式的错误
-        error = S3Error(
-            Code="NoSuchBucket",
-            Message=f"The specified bucket {bucket} does not exist",
-            Resource=f"/{bucket}",
-            RequestId="notion-s3-api"
-        )
-
-        root = ET.Element("Error")
-        for key, value in error.dict().items():
-            child = ET.SubElement(root, key)
-            child.text = str(value)
-
-        xml_str = ET.tostring(root, encoding="utf-8", method="xml")
-        return Response(content=xml_str, media_type="application/xml", status_code=404)
+        return _s3_error_response("NoSuchBucket", f"The specified bucket {bucket} does not exist", f"/{bucket}")
 
     # 对prefix进行URL解码处理
     decoded_prefix = decode_url_encoding(prefix)
-    print(f"原始prefix: {prefix}")
-    print(f"解码后prefix: {decoded_prefix}")
+    logger.debug("原始prefix: %s, 解码后prefix: %s", prefix, decoded_prefix)
 
     # 对delimiter进行URL解码处理
     decoded_delimiter = decode_url_encoding(delimiter)
 
     # 列出对象
-    response = await s3_adapter.list_objects(bucket, decoded_prefix, decoded_delimiter, max_keys)
+    response = await adapter.list_objects(bucket, decoded_prefix, decoded_delimiter, max_keys)
 
-    # 过滤内容，移除不需要的条目
+    # 过滤内容，移除不需要的条目（单次遍历，partition 只扫描一次 key）
     filtered_contents = []
     common_prefixes = set()
-
-    # 过滤掉ID形式的文件
-    id_pattern = r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$'
+    add_prefix = common_prefixes.add
+    append_content = filtered_contents.append
+    prefix_depth = decoded_prefix.count('/') + 1 if decoded_prefix else 1
 
     for obj in response.Contents:
-        # 过滤掉与 bucket 名称相同的 key
-        if obj.Key == bucket:
-            continue
+        key = obj.Key
 
-        # 过滤掉ID形式的文件
-        import re
-        if re.match(id_pattern, obj.Key):
+        # 过滤掉与 bucket 名称相同的 key 以及 ID 形式的文件
+        if key == bucket or _ID_KEY_RE.match(key):
             continue
 
-        # 处理文件夹
-        if obj.Key.endswith('/'):
-            # 如果是文件夹，添加到公共前缀集合
-            folder_path = obj.Key
-
-            # 如果有前缀，则使用前缀过滤
-            if decoded_prefix:
-                # 如果当前文件夹是前缀的直接子文件夹
-                if folder_path.startswith(decoded_prefix) and folder_path.count('/') == decoded_prefix.count('/') + 1:
-                    common_prefixes.add(folder_path)
+        if decoded_prefix:
+            if key.endswith('/'):
+                # 前缀的直接子文件夹
+                if key.startswith(decoded_prefix) and key.count('/') == prefix_depth:
+                    add_prefix(key)
             else:
-                # 如果没有前缀，则只显示顶级文件夹
-                if folder_path.count('/') == 1:
-                    common_prefixes.add(folder_path)
+                # 前缀指定文件夹中的文件
+                head, sep, _ = key.rpartition('/')
+                if sep and head + sep == decoded_prefix:
+                    append_content(obj)
             continue
 
-        # 处理文件
-        if '/' in obj.Key:
-            # 如果文件在文件夹中
-            folder_path = obj.Key.rsplit('/', 1)[0] + '/'
-
-            # 如果有前缀，则使用前缀过滤
-            if decoded_prefix:
-                # 如果当前文件在前缀指定的文件夹中
-                if folder_path == decoded_prefix:
-                    filtered_contents.append(obj)
-            else:
-                # 如果没有前缀，则只显示顶级文件夹中的文件
-                top_folder = obj.Key.split('/', 1)[0] + '/'
-                common_prefixes.add(top_folder)
+        # 没有前缀时，只显示顶级文件夹和根目录中的文件
+        head, sep, tail = key.partition('/')
+        if sep:
+            # 顶级文件夹本身，或文件夹中文件所在的顶级文件夹
+            if not tail or tail[-1] != '/':
+                add_prefix(head + sep)
         else:
-            # 如果文件在根目录中
-            if not decoded_prefix:
-                filtered_contents.append(obj)
+            append_content(obj)
 
-    # 替换原始内容
-    response.Contents = filtered_contents
-
-    # 添加公共前缀作为文件夹
-    common_prefix_objects = []
-    for prefix in common_prefixes:
-        common_prefix_objects.append(S3CommonPrefix(Prefix=prefix))
-    response.CommonPrefixes = common_prefix_objects
+    # 替换原始内容并添加公共前缀作为文件夹；适配器会缓存原始响应，因此复制而不是原地修改
+    response = response.model_copy(update={
+        "Contents": filtered_contents,
+        "CommonPrefixes": [S3CommonPrefix(Prefix=prefix) for prefix in common_prefixes],
+    })
 
     # 打印文件夹结构
-    print("\n=== 文件夹结构 ===\n")
-    print(f"\u5f53前前缀: {decoded_prefix or '无'}")
-    print(f"\u5206隔符: {decoded_delimiter or '无'}")
-    print("\n文件夹:")
-    for prefix_obj in response.CommonPrefixes:
-        print(f"  - {prefix_obj.Prefix}")
-    print("\n文件:")
-    for obj in response.Contents:
-        print(f"  - {obj.Key} (大小: {obj.Size} 字节)")
-    print("\n===================\n")
-
-    # 转换为 XML
-    root = ET.Element("ListBucketResult")
-    ET.SubElement(root, "Name").text = response.Name
-    ET.SubElement(root, "Prefix").text = response.Prefix
-    ET.SubElement(root, "Marker").text = response.Marker
-    ET.SubElement(root, "MaxKeys").text = str(response.MaxKeys)
-    ET.SubElement(root, "IsTruncated").text = str(response.IsTruncated).lower()
-
-    # 添加内容
-    for obj in response.Contents:
-        content = ET.SubElement(root, "Contents")
-        ET.SubElement(content, "Key").text = obj.Key
-        ET.SubElement(content, "LastModified").text = obj.LastModified.isoformat()
-        ET.SubElement(content, "ETag").text = obj.ETag
-        ET.SubElement(content, "Size").text = str(obj.Size)
-        ET.SubElement(content, "StorageClass").text = obj.StorageClass
-
-        owner = ET.SubElement(content, "Owner")
-        ET.SubElement(owner, "DisplayName").text = obj.Owner["DisplayName"]
-
-    # 添加公共前缀（文件夹）
-    for prefix_obj in response.CommonPrefixes:
-        common_prefix = ET.SubElement(root, "CommonPrefixes")
-        ET.SubElement(common_prefix, "Prefix").text = prefix_obj.Prefix
-
-    xml_str = ET.tostring(root, encoding="utf-8", method="xml")
-    return Response(content=xml_str, media_type="application/xml")
+    if logger.isEnabledFor(logging.DEBUG):
+        lines = [
+            "=== 文件夹结构 ===",
+            f"当前前缀: {decoded_prefix or '无'}",
+            f"分隔符: {decoded_delimiter or '无'}",
+            "文件夹:"
+        ]
+        lines.extend(f"  - {prefix_obj.Prefix}" for prefix_obj in response.CommonPrefixes)
+        lines.append("文件:")
+        lines.extend(f"  - {obj.Key} (大小: {obj.Size} 字节)" for obj in response.Contents)
+        logger.debug("\n".join(lines))
+
+    # 转换为 XML（在线程池中执行，避免阻塞事件循环）
+    xml_str = await run_in_threadpool(_build_list_xml, response, adapter.content_rows)
+
+    # 更新响应缓存（期间发生过缓存失效时不缓存）
+    etag = f'"{hashlib.blake2b(xml_str, digest_size=8).hexdigest()}"'
+    expires_at = time.monotonic() + settings.CACHE_EXPIRATION
+    if generation == notion_api.generation:
+        if len(_list_response_cache) >= _LIST_RESPONSE_CACHE_SIZE:
+            # 移除最早加入的条目
+            _list_response_cache.pop(next(iter(_list_response_cache)))
+        _list_response_cache[cache_key] = (expires_at, etag, xml_str)
+
+    return _list_response(request, etag, xml_str, expires_at)
 
 
 @app.get("/{bucket}/{key:path}")
@@ -367,53 +526,36 @@ async def get_object(
     key: str
 ):
     """从存储桶获取对象（S3 兼容）"""
+    # 对key进行URL解码处理
+    decoded_key = decode_url_encoding(key)
+    logger.debug("原始key: %s, 解码后key: %s", key, decoded_key)
+
+    # 先查询已有的适配器（即使存储桶缓存已过期），文件 URL 仍有效时无需重新抓取 Notion
+    cached = _bucket_cache.get(detect_notion_id_type(bucket)[1])
+    if cached is not None:
+        cached_adapter = cached[3]
+        url = await cached_adapter.generate_presigned_url(decoded_key)
+        if url:
+            expiration_time = cached_adapter.get_expiration_time(decoded_key)
+            if expiration_time is None or datetime.now() < expiration_time:
+                return RedirectResponse(url)
+
     # 处理 Notion 数据（存储桶名称就是 Notion ID）
     try:
-        await process_notion_data(bucket)
+        _, adapter = await process_notion_data(bucket)
     except Exception as e:
         # 返回 S3 格式的错误
-        error = S3Error(
-            Code="NoSuchBucket",
-            Message=f"The specified bucket {bucket} does not exist",
-            Resource=f"/{bucket}/{key}",
-            RequestId="notion-s3-api"
-        )
-
-        root = ET.Element("Error")
-        for k, value in error.model_dump().items():
-            child = ET.SubElement(root, k)
-            child.text = str(value)
-
-        xml_str = ET.tostring(root, encoding="utf-8", method="xml")
-        return Response(content=xml_str, media_type="application/xml", status_code=404)
-
-    # 对key进行URL解码处理
-    decoded_key = decode_url_encoding(key)
-    print(f"原始key: {key}")
-    print(f"解码后key: {decoded_key}")
+        return _s3_error_response("NoSuchBucket", f"The specified bucket {bucket} does not exist", f"/{bucket}/{key}")
 
     # 获取对象
-    obj = await s3_adapter.get_object(decoded_key)
+    obj = await adapter.get_object(decoded_key)
 
     if not obj:
         # 返回 S3 格式的错误
-        error = S3Error(
-            Code="NoSuchKey",
-            Message=f"The specified key {decoded_key} does not exist",
-            Resource=f"/{bucket}/{decoded_key}",
-            RequestId="notion-s3-api"
-        )
-
-        root = ET.Element("Error")
-        for k, value in error.model_dump().items():
-            child = ET.SubElement(root, k)
-            child.text = str(value)
-
-        xml_str = ET.tostring(root, encoding="utf-8", method="xml")
-        return Response(content=xml_str, media_type="application/xml", status_code=404)
+        return _s3_error_response("NoSuchKey", f"The specified key {decoded_key} does not exist", f"/{bucket}/{decoded_key}")
 
     # 生成预签名 URL
-    url = await s3_adapter.generate_presigned_url(decoded_key)
+    url = await adapter.generate_presigned_url(decoded_key)
 
     if url:
         # 重定向到 URL
@@ -431,4 +573,12 @@ if __name__ == "__main__":
     print(f"1. API 格式获取文件链接： GET /api/你的_notion_id")
     print(f"2. S3 兼容格式获取文件列表： GET /你的_notion_id")
     print(f"3. S3 兼容格式获取文件： GET /你的_notion_id/文件路径\n")
-    uvicorn.run(app, host=settings.API_HOST, port=settings.API_PORT)
+    # 安装 uvicorn[standard] 后，auto 会选用 uvloop 事件循环和 httptools 解析器
+    uvicorn.run(
+        "main:app" if settings.API_WORKERS > 1 else app,
+        host=settings.API_HOST,
+        port=settings.API_PORT,
+        workers=settings.API_WORKERS,
+        loop="auto",
+        http="auto"
+    )
@@ -1,6 +1,6 @@
 from enum import Enum
 from typing import List, Dict, Optional, Any, Union
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from datetime import datetime
 
 
@@ -14,6 +14,8 @@ class NotionIdType(str, Enum):
 
 class NotionObject(BaseModel):
     """表示 Notion 对象的模型"""
+    model_config = ConfigDict(extra="ignore", frozen=True)  # 抓取结果在缓存中共享，不允许修改
+
     id: str  # 对象 ID
     type: NotionIdType  # 对象类型
     title: str  # 对象标题
@@ -25,6 +27,8 @@ class NotionObject(BaseModel):
 
 class NotionFile(BaseModel):
     """表示 Notion 文件的模型"""
+    model_config = ConfigDict(extra="ignore", frozen=True)  # 同一实例由提取缓存和多个适配器共用
+
     id: str  # 文件 ID
     name: str  # 文件名称
     type: str  # 文件类型
@@ -36,6 +40,8 @@ class NotionFile(BaseModel):
 
 class NotionFolder(BaseModel):
     """表示 Notion 文件夹的模型"""
+    model_config = ConfigDict(extra="ignore", frozen=True)  # 子项在创建前收集完毕
+
     id: str  # 文件夹 ID
     name: str  # 文件夹名称
     parent_id: Optional[str] = None  # 父文件夹 ID
@@ -44,6 +50,8 @@ class NotionFolder(BaseModel):
 
 class S3Object(BaseModel):
     """表示 S3 对象的模型"""
+    model_config = ConfigDict(extra="ignore", frozen=True)  # 适配器在多次列表响应之间直接复用
+
     Key: str  # 对象键名
     LastModified: datetime  # 最后修改时间
     ETag: str  # 实体标签
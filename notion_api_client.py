@@ -1,17 +1,161 @@
 import os
 import json
 import asyncio
-from typing import Dict, List, Optional, Any, Tuple, Set
+import logging
+import random
+import time
+import importlib.util
+from typing import AsyncIterator, Callable, Dict, List, Optional, Any, Set, Tuple, Union
 import urllib.parse
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from datetime import datetime, timedelta
 
-from notion_client import Client, AsyncClient
-from notion_client.errors import APIResponseError
+import httpx
+from aiolimiter import AsyncLimiter
+from cachetools import LRUCache, TLRUCache, TTLCache
+from notion_client import AsyncClient
+from notion_client.errors import APIResponseError, HTTPResponseError, RequestTimeoutError
+
+try:
+    import diskcache
+except ImportError:  # 可选依赖，仅在设置 CACHE_DIR 时需要
+    diskcache = None
 
 from config import settings
 from models import NotionIdType, NotionObject, NotionFile, NotionFolder
 from utils import detect_notion_id_type, decode_url_encoding, is_file_block
 
+logger = logging.getLogger(__name__)
+
+# 遇到限流、服务端临时错误或网络错误时的重试设置
+_RETRY_STATUSES = frozenset((429, 502, 503, 504))
+_MAX_ATTEMPTS = 5
+_RETRY_BASE_DELAY = 0.5  # 秒
+_RETRY_MAX_DELAY = 30.0  # 秒
+
+# 已知类型对应的 retrieve 接口
+_RETRIEVE_KINDS = {
+    NotionIdType.PAGE: "pages",
+    NotionIdType.DATABASE: "databases",
+    NotionIdType.BLOCK: "blocks",
+}
+
+# 标题类块的类型
+_HEADING_TYPES = frozenset(("heading_1", "heading_2", "heading_3"))
+
+# 安装了 h2 时启用 HTTP/2，并发请求复用同一个 TCP 连接
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# 需要作为子页面继续遍历的块类型及其对象类型
+_CHILD_OBJECT_TYPES = {
+    "child_page": NotionIdType.PAGE,
+    "child_database": NotionIdType.DATABASE,
+}
+
+# 子项分页大小（Notion API 允许的最大值）
+_PAGE_SIZE = 100
+
+
+def _canonical_id(notion_id: str) -> str:
+    """返回规范化（带破折号）的 Notion ID，用作缓存键，使不同写法的同一 ID 共享缓存"""
+    return detect_notion_id_type(notion_id)[1]
+
+
+# 缓存键前缀，前缀之后是对象的规范化 ID
+_CACHE_KEY_PREFIXES = ("id_type_", "pages_", "databases_", "blocks_", "children_", "subpages_", "files_")
+
+
+def _cache_key_tag(key: str) -> Optional[str]:
+    """返回缓存键所属对象的规范化 ID"""
+    for prefix in _CACHE_KEY_PREFIXES:
+        if key.startswith(prefix):
+            return key[len(prefix):].split("_", 1)[0]
+    return None
+
+
+def _cache_ttl(key: str, data: Any) -> float:
+    """缓存条目的有效期（秒）
+
+    文件列表和子项列表中包含带签名的 URL，缓存时间不能超过其中最早过期的 URL
+    """
+    ttl = settings.CACHE_EXPIRATION
+    if key.startswith("files_") and data:
+        remaining = (min(file.expiration_time for file in data) - datetime.now()).total_seconds()
+        ttl = max(0.0, min(ttl, remaining))
+    elif key.startswith("children_"):
+        # 子项列表: (获取时间, 子项)，其中的 URL 自获取时起计算有效期
+        remaining = (data[0] - datetime.now()).total_seconds() + settings.PRESIGNED_URL_EXPIRATION
+        ttl = max(0.0, min(ttl, remaining))
+    return ttl
+
+
+def _parse_notion_time(value: Optional[str]) -> datetime:
+    """解析 Notion 返回的 ISO 时间字符串，缺失时使用当前时间"""
+    if not value:
+        return datetime.now()
+    # Python 3.11 之前的 fromisoformat 不支持结尾的 Z
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    return datetime.fromisoformat(value)
+
+
+def _local_time(value: Optional[str]) -> datetime:
+    """将 Notion 返回的时间转换为不带时区的本地时间，可与 datetime.now() 比较"""
+    return _parse_notion_time(value).astimezone().replace(tzinfo=None)
+
+
+@lru_cache(maxsize=4096)
+def _filename_from_url(url: str) -> str:
+    """从 URL 路径中提取并解码文件名
+
+    调用方先去掉查询参数，同一文件不同签名的 URL 可共用缓存结果
+    """
+    return decode_url_encoding(os.path.basename(urllib.parse.urlsplit(url).path))
+
+
+def _plain_text(rich_text: Any) -> str:
+    """拼接富文本数组中的纯文本"""
+    if not rich_text or not isinstance(rich_text, list):
+        return ""
+    # 大多数标题只有一个片段，无需拼接
+    if len(rich_text) == 1:
+        return rich_text[0].get("plain_text", "") or ""
+    return "".join([part.get("plain_text", "") for part in rich_text])
+
+
+def _extract_url(block_content: Any) -> str:
+    """从文件类块的内容中提取 URL
+
+    依次检查直接的 url 字段，以及 type 指定的字段、file、external 下的 url
+    """
+    if not isinstance(block_content, dict):
+        return ""
+
+    url = block_content.get("url")
+    if isinstance(url, str) and url:
+        return url
+
+    for field in (block_content.get("type"), "file", "external"):
+        nested = block_content.get(field) if field else None
+        if isinstance(nested, dict):
+            url = nested.get("url")
+            if isinstance(url, str) and url:
+                return url
+    return ""
+
+
+def _extract_expiry(block_content: Any) -> Optional[datetime]:
+    """从文件类块的内容中提取 Notion 托管文件 URL 的实际过期时间，外部文件没有该字段"""
+    if not isinstance(block_content, dict):
+        return None
+
+    for field in (block_content.get("type"), "file"):
+        nested = block_content.get(field) if field else None
+        if isinstance(nested, dict) and nested.get("expiry_time"):
+            return _local_time(nested["expiry_time"])
+    return None
+
 
 class NotionAPI:
     def __init__(self, api_key: str = None):
@@ -20,319 +164,637 @@ class NotionAPI:
         if not self.api_key:
             raise ValueError("需要提供 Notion API 密钥，请在 .env 文件中设置 NOTION_API_KEY")
 
-        print(f"使用 Notion API 密钥: {self.api_key[:5]}...{self.api_key[-5:]}")
-        self.client = Client(auth=self.api_key)
-        self.async_client = AsyncClient(auth=self.api_key)
-        self.cache = {}
-        self.cache_expiration = {}
-
-        # 并发请求限制
-        self.semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_REQUESTS)
+        logger.debug("使用 Notion API 密钥: %s...%s", self.api_key[:5], self.api_key[-5:])
+        # 使用异步客户端，HTTP 请求等待期间让出事件循环，并行抓取才能真正重叠；
+        # 连接池大小与并发上限匹配，保持长连接以省去重复的 TLS 握手
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.MAX_CONCURRENT_REQUESTS * 2,
+                max_keepalive_connections=settings.MAX_CONCURRENT_REQUESTS,
+            ),
+            http2=_HTTP2_AVAILABLE,
+        )
+        self.client = AsyncClient(auth=self.api_key, client=self._http)
+        # 带容量上限的 TTL 缓存，过期和超出容量的条目自动淘汰；每个条目的有效期由 _cache_ttl 决定
+        self.cache = TLRUCache(maxsize=settings.CACHE_MAX_ENTRIES, ttu=self._ttu)
+        # 从磁盘缓存恢复的条目的剩余有效期: 缓存键 -> 秒，写入内存时由 _ttu 取用
+        self._restored_ttl: Dict[str, float] = {}
+        # 对象 ID -> 该对象的全部缓存键，用于按对象精确失效
+        self._tags: LRUCache = LRUCache(maxsize=settings.CACHE_MAX_ENTRIES)
+        # 已识别的对象类型: ID -> 类型；类型不会改变，对象数据过期后无需重新探测
+        self._id_types: LRUCache = LRUCache(maxsize=settings.CACHE_MAX_ENTRIES)
+        # 列出子项时记录的父对象: 子对象 ID -> 父对象 ID，失效时据此向上删除汇总结果
+        self._parents: LRUCache = LRUCache(maxsize=settings.CACHE_MAX_ENTRIES)
+        # 缓存命中统计，用于观察缓存效果
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # 设置 CACHE_DIR 时使用磁盘缓存作为第二层，重启后仍可命中
+        self._store = None
+        if settings.CACHE_DIR:
+            if diskcache is None:
+                logger.warning("设置了 CACHE_DIR 但未安装 diskcache，仅使用内存缓存")
+            else:
+                self._store = diskcache.Cache(settings.CACHE_DIR)
+        # 按父对象编辑时间校验的子项列表: 缓存键 -> (编辑时间, 获取时间, 子项)
+        # 子项中的文件 URL 自获取时起约 1 小时后失效，保留时间不超过该时长
+        self._validated_children = TTLCache(
+            maxsize=settings.CACHE_MAX_ENTRIES,
+            ttl=min(settings.CACHE_REVALIDATE_WINDOW, settings.PRESIGNED_URL_EXPIRATION)
+        )
+        # 已提取的文件: (块 ID, 编辑时间, URL) -> 文件；同一带签名 URL 的过期时间固定，保留时间不超过 URL 有效期
+        self._file_cache = TTLCache(maxsize=settings.CACHE_MAX_ENTRIES, ttl=settings.PRESIGNED_URL_EXPIRATION)
+        # 按对象类型分派的标题提取函数及其失败时的默认标题
+        self._title_handlers = {
+            NotionIdType.PAGE: (self._page_title, "Untitled Page"),
+            NotionIdType.DATABASE: (self._database_title, "Untitled Database"),
+            NotionIdType.BLOCK: (self._block_title, "Block"),
+        }
+
+        # 进行中的对象获取任务: 缓存键 -> 任务
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # 缓存代数，每次失效时递增；开始于失效之前的获取完成后不再写入缓存
+        self.generation = 0
+
+        # 并发请求限制，在每次实际调用 Notion API 时获取，嵌套的抓取流程不会占用名额；
+        # 使用 Condition + 计数器而不是 Semaphore，以便运行时调整上限
+        self._slot_cond = asyncio.Condition()
+        self._active_requests = 0
+        self._max_requests = settings.MAX_CONCURRENT_REQUESTS
+
+        # 令牌桶限速，遵守 Notion API 每秒请求数限制
+        self.rate_limiter = AsyncLimiter(settings.NOTION_REQUESTS_PER_SECOND, 1.0)
+
+    async def aclose(self) -> None:
+        """取消进行中的请求任务并关闭底层 HTTP 连接池"""
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.client.aclose()
+        if self._store is not None:
+            self._store.close()
+
+    def _ttu(self, key: str, data: Any, now: float) -> float:
+        """内存缓存条目的过期时刻；从磁盘缓存恢复的条目沿用其剩余有效期，不重新计时"""
+        ttl = self._restored_ttl.pop(key, None)
+        return now + (_cache_ttl(key, data) if ttl is None else ttl)
 
     def _get_from_cache(self, key: str) -> Optional[Any]:
         """Get data from cache if it exists and is not expired"""
-        if key in self.cache and key in self.cache_expiration:
-            if datetime.now() < self.cache_expiration[key]:
-                return self.cache[key]
-        return None
-
-    def _add_to_cache(self, key: str, data: Any) -> None:
-        """Add data to cache with expiration"""
+        data = self.cache.get(key)
+        if data is None and self._store is not None:
+            # 内存未命中时查询磁盘缓存，命中后放回内存并登记标签，失效时可以找到
+            data, expire_time = self._store.get(key, expire_time=True)
+            if data is not None:
+                self._restored_ttl[key] = expire_time - time.time() if expire_time else _cache_ttl(key, data)
+                self.cache[key] = data
+                self._register_tag(key)
+        if data is None:
+            self.cache_misses += 1
+        else:
+            self.cache_hits += 1
+        return data
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """返回缓存条目数及命中统计"""
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "entries": len(self.cache),
+            "max_entries": self.cache.maxsize,
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_ratio": round(self.cache_hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _add_to_cache(self, key: str, data: Any, generation: Optional[int] = None) -> None:
+        """Add data to cache with expiration
+
+        generation 为获取开始时的缓存代数，期间发生过失效时结果可能已过时，不写入缓存
+        """
+        if generation is not None and generation != self.generation:
+            return
         self.cache[key] = data
-        self.cache_expiration[key] = datetime.now() + timedelta(seconds=settings.CACHE_EXPIRATION)
+        if self._store is not None:
+            self._store.set(key, data, expire=_cache_ttl(key, data))
+        self._register_tag(key)
+
+    def _register_tag(self, key: str) -> None:
+        """将缓存键登记到所属对象的标签下，用于按对象精确失效"""
+        tag = _cache_key_tag(key)
+        if tag:
+            keys = self._tags.get(tag)
+            if keys is None:
+                self._tags[tag] = keys = set()
+            keys.add(key)
+
+    def _cache_keys(self) -> Set[str]:
+        """返回内存缓存、子项校验缓存和磁盘缓存中的全部键"""
+        keys = set(self.cache.keys())
+        keys.update(self._validated_children.keys())
+        if self._store is not None:
+            keys.update(self._store.iterkeys())
+        return keys
+
+    def _peek(self, key: str) -> Optional[Any]:
+        """读取条目用于失效遍历：已过期的子项列表仍可从校验缓存或磁盘缓存中取得"""
+        data = self.cache.get(key)
+        if data is None and key.startswith("children_"):
+            validated = self._validated_children.get(key)
+            if validated is not None:
+                data = validated[1:]
+        if data is None and self._store is not None:
+            data = self._store.get(key)
+        return data
+
+    def invalidate(self, target: Union[str, Callable[[str], bool]]) -> Set[str]:
+        """使缓存失效，返回受影响对象的规范化 ID
+
+        target 为 Notion ID 时删除该对象及其全部后代的条目和已提取的文件，
+        并删除上级对象中包含它的汇总结果（子页面、文件列表）；
+        为函数时删除所有键满足该条件的条目
+        """
+        if callable(target):
+            keys = {key for key in self._cache_keys() if target(key)}
+            ids = {tag for tag in map(_cache_key_tag, keys) if tag}
+        else:
+            keys = set()
+            ids = set()
+            pending = [_canonical_id(target)]
+            while pending:
+                tag = pending.pop()
+                if tag in ids:
+                    continue
+                ids.add(tag)
+                tag_keys = self._tags.pop(tag, set())
+                # 除子页面外，对象自身的缓存键是固定的，标签索引已被淘汰时也能找到
+                tag_keys.update(prefix + tag for prefix in _CACHE_KEY_PREFIXES if prefix != "subpages_")
+                for key in tag_keys:
+                    keys.add(key)
+                    # 沿子项和子页面继续向下失效
+                    if not key.startswith(("children_", "subpages_")):
+                        continue
+                    data = self._peek(key)
+                    if not data:
+                        continue
+                    if key.startswith("children_"):
+                        pending.extend(_canonical_id(child["id"]) for child in data[1] if child.get("id"))
+                    else:
+                        pending.extend(_canonical_id(obj_id) for obj_id in data)
+
+            # 沿记录的父对象向上，删除上级对象的汇总结果，其中包含了已失效的内容
+            ancestors = set()
+            for tag in list(ids):
+                parent = self._parents.get(tag)
+                while parent is not None and parent not in ids and parent not in ancestors:
+                    ancestors.add(parent)
+                    parent_keys = self._tags.get(parent, set())
+                    aggregates = {key for key in parent_keys if key.startswith(("subpages_", "files_"))}
+                    aggregates.add(f"files_{parent}")
+                    parent_keys -= aggregates
+                    keys |= aggregates
+                    parent = self._parents.get(parent)
+            ids |= ancestors
+
+        # 进行中的获取完成后不再写回缓存；之后的请求不再合并到这些获取上，而是重新获取
+        self.generation += 1
+        for key in keys:
+            self.cache.pop(key, None)
+            self._validated_children.pop(key, None)
+            self._inflight.pop(key, None)
+            if self._store is not None:
+                self._store.delete(key)
+
+        # 已识别的类型和已提取的文件同样按对象 ID 清除，下次重新获取
+        for tag in ids:
+            self._id_types.pop(tag, None)
+        for memo_key in [memo_key for memo_key in list(self._file_cache.keys()) if _canonical_id(memo_key[0]) in ids]:
+            self._file_cache.pop(memo_key, None)
+        return ids
+
+    @asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        """占用一个 Notion API 并发名额"""
+        async with self._slot_cond:
+            await self._slot_cond.wait_for(lambda: self._active_requests < self._max_requests)
+            self._active_requests += 1
+        try:
+            yield
+        finally:
+            async with self._slot_cond:
+                self._active_requests -= 1
+                self._slot_cond.notify()
+
+    async def set_concurrency(self, limit: int) -> None:
+        """调整同时进行的 Notion API 请求数上限"""
+        async with self._slot_cond:
+            self._max_requests = max(1, limit)
+            self._slot_cond.notify_all()
+
+    async def _call(self, fn, *args, **kwargs) -> Any:
+        """调用 Notion API，遇到 429/5xx 或连接、超时错误时按 Retry-After 或全抖动指数退避重试"""
+        for attempt in range(_MAX_ATTEMPTS):
+            try:
+                async with self._slot(), self.rate_limiter:
+                    return await fn(*args, **kwargs)
+            except (httpx.TransportError, RequestTimeoutError):
+                # 连接被重置、超时等传输层错误（notion_client 将超时包装为 RequestTimeoutError）
+                if attempt == _MAX_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(random.uniform(0, min(_RETRY_MAX_DELAY, _RETRY_BASE_DELAY * 2 ** attempt)))
+            except HTTPResponseError as e:
+                # APIResponseError 是 HTTPResponseError 的子类；网关错误可能只有后者
+                if e.status not in _RETRY_STATUSES or attempt == _MAX_ATTEMPTS - 1:
+                    raise
+
+                delay = None
+                retry_after = e.headers.get("Retry-After") if e.headers else None
+                if retry_after:
+                    try:
+                        delay = min(float(retry_after), _RETRY_MAX_DELAY)
+                    except ValueError:
+                        pass
+                if delay is None:
+                    delay = random.uniform(0, min(_RETRY_MAX_DELAY, _RETRY_BASE_DELAY * 2 ** attempt))
+                await asyncio.sleep(delay)
+
+    async def _single_flight(self, key: str, factory, cache_result: bool = True) -> Any:
+        """合并进行中的相同请求，并发调用方共享同一个任务
 
-    async def identify_id_type(self, notion_id: str) -> Tuple[NotionIdType, Dict[str, Any]]:
+        cache_result 为 True 时，任务成功后将结果写入 TTL 缓存
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            generation = self.generation
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+
+            def _done(t: asyncio.Future) -> None:
+                if self._inflight.get(key) is t:
+                    del self._inflight[key]
+                if cache_result and not t.cancelled() and t.exception() is None:
+                    self._add_to_cache(key, t.result(), generation)
+
+            task.add_done_callback(_done)
+
+        # shield 防止某个调用方被取消时连带取消其他调用方共享的任务
+        return await asyncio.shield(task)
+
+    async def _retrieve(self, kind: str, object_id: str) -> Dict[str, Any]:
+        """获取页面/数据库/块对象，优先使用 TTL 缓存并合并进行中的相同请求"""
+        # 同一 ID 作为页面和作为块获取的结果不同，因此缓存键包含对象种类
+        cache_key = f"{kind}_{_canonical_id(object_id)}"
+        cached_data = self._get_from_cache(cache_key)
+        if cached_data is not None:
+            return cached_data
+
+        return await self._single_flight(cache_key, lambda: self._call(getattr(self.client, kind).retrieve, object_id))
+
+    async def identify_id_type(self, notion_id: str, known_type: Optional[NotionIdType] = None) -> Tuple[NotionIdType, Dict[str, Any]]:
         """
         Identify the type of a Notion ID (page, block, database)
         and return the object data
+
+        known_type 为调用方已知的类型（如父对象子项列表中的 child_page/child_database），
+        有时直接按该类型获取，无需逐个探测
         """
-        # Check cache first
-        cache_key = f"id_type_{notion_id}"
+        # Normalize the ID format, then check cache (keyed by the canonical ID)
+        id_type, formatted_id = detect_notion_id_type(notion_id)
+        if known_type is not None:
+            id_type = known_type
+        cache_key = f"id_type_{formatted_id}"
         cached_data = self._get_from_cache(cache_key)
         if cached_data:
             return cached_data
 
-        # Normalize the ID format
-        id_type, formatted_id = detect_notion_id_type(notion_id)
+        # 同一 ID 的并发识别共享一次探测；结果由 _identify_id_type 自行缓存（未知类型不缓存）
+        result = await self._single_flight(
+            cache_key,
+            lambda: self._identify_id_type(id_type, formatted_id, cache_key),
+            cache_result=False
+        )
+        if result[0] != NotionIdType.UNKNOWN:
+            self._id_types[formatted_id] = result[0]
+        return result
+
+    async def _identify_id_type(self, id_type: NotionIdType, formatted_id: str, cache_key: str) -> Tuple[NotionIdType, Dict[str, Any]]:
+        """探测 ID 类型并获取对象数据"""
+        generation = self.generation
+
+        # 调用方已知类型或之前识别过的 ID 直接按该类型获取
         if id_type == NotionIdType.UNKNOWN:
-            # Try to retrieve as different types
+            id_type = self._id_types.get(formatted_id, NotionIdType.UNKNOWN)
+        if id_type != NotionIdType.UNKNOWN:
             try:
-                # Try as page
-                page_data = self.client.pages.retrieve(formatted_id)
-                result = (NotionIdType.PAGE, page_data)
-                self._add_to_cache(cache_key, result)
+                result = (id_type, await self._retrieve(_RETRIEVE_KINDS[id_type], formatted_id))
+                self._add_to_cache(cache_key, result, generation)
                 return result
             except APIResponseError as e:
-                print(f"Not a page: {e}")
-                try:
-                    # Try as database
-                    db_data = self.client.databases.retrieve(formatted_id)
-                    result = (NotionIdType.DATABASE, db_data)
-                    self._add_to_cache(cache_key, result)
-                    return result
-                except APIResponseError as e:
-                    print(f"Not a database: {e}")
-                    try:
-                        # Try as block
-                        block_data = self.client.blocks.retrieve(formatted_id)
-                        result = (NotionIdType.BLOCK, block_data)
-                        self._add_to_cache(cache_key, result)
-                        return result
-                    except APIResponseError as e:
-                        # Unknown or inaccessible
-                        print(f"Not a block: {e}")
-                        print(f"API Key: {self.api_key[:5]}...{self.api_key[-5:]}")
-                        print(f"Formatted ID: {formatted_id}")
-                        return NotionIdType.UNKNOWN, {}
-
-        return id_type, {}
-
-    async def get_page_title(self, page_id: str) -> str:
-        """Get the title of a page"""
+                # 对象可能已被删除或取消共享，重新探测
+                logger.debug("按已知类型获取 %s 失败: %s", formatted_id, e)
+                self._id_types.pop(formatted_id, None)
+
+        # 大多数 ID 是页面，先单独尝试页面，避免每次识别都发出三个请求
         try:
-            page = self.client.pages.retrieve(page_id)
-            # Extract title from properties
-            title_prop = None
-            for prop_name, prop_data in page.get("properties", {}).items():
+            page_data = await self._retrieve("pages", formatted_id)
+            result = (NotionIdType.PAGE, page_data)
+            self._add_to_cache(cache_key, result, generation)
+            return result
+        except APIResponseError as e:
+            logger.debug("Not a page: %s", e)
+
+        # 不是页面时并行尝试数据库和块，只多等待一次往返
+        db_data, block_data = await asyncio.gather(
+            self._retrieve("databases", formatted_id),
+            self._retrieve("blocks", formatted_id),
+            return_exceptions=True
+        )
+        for kind, data in ((NotionIdType.DATABASE, db_data), (NotionIdType.BLOCK, block_data)):
+            if not isinstance(data, BaseException):
+                result = (kind, data)
+                self._add_to_cache(cache_key, result, generation)
+                return result
+
+        # 非 API 响应错误（如网络错误）照常抛出
+        for error in (db_data, block_data):
+            if not isinstance(error, APIResponseError):
+                raise error
+
+        # Unknown or inaccessible
+        logger.warning("无法识别 Notion ID %s: %s", formatted_id, block_data)
+        return NotionIdType.UNKNOWN, {}
+
+    @staticmethod
+    def _page_title(page: Dict[str, Any], page_id: str) -> str:
+        """从页面对象中提取标题"""
+        # Extract title from properties
+        props = page.get("properties")
+        if props:
+            for prop_data in props.values():
                 if prop_data.get("type") == "title":
-                    title_prop = prop_data
+                    title_parts = prop_data.get("title")
+                    if title_parts is not None:
+                        return _plain_text(title_parts)
                     break
+        return f"Untitled Page ({page_id})"
+
+    @staticmethod
+    def _database_title(db: Dict[str, Any], database_id: str) -> str:
+        """从数据库对象中提取标题"""
+        return _plain_text(db.get("title"))
+
+    @staticmethod
+    def _block_title(block: Dict[str, Any], block_id: str) -> str:
+        """从块对象中提取有代表性的标题"""
+        block_type = block.get("type", "")
+
+        # Different block types have different title representations
+        if block_type in _HEADING_TYPES:
+            content = block.get(block_type)
+            return _plain_text(content.get("rich_text")) if content else ""
+        elif block_type == "paragraph":
+            content = block.get("paragraph")
+            text = _plain_text(content.get("rich_text")) if content else ""
+            # Truncate long paragraphs
+            return text[:50] + "..." if len(text) > 50 else text
+        elif is_file_block(block):
+            return f"{block_type.capitalize()} Block"
+        else:
+            return f"{block_type.capitalize()} Block ({block_id})"
 
-            if title_prop and "title" in title_prop:
-                title_parts = title_prop["title"]
-                return "".join([part.get("plain_text", "") for part in title_parts])
-            return f"Untitled Page ({page_id})"
-        except Exception as e:
+    def _title_from_obj(self, obj_data: Dict[str, Any], id_type: NotionIdType, notion_id: str) -> str:
+        """从已获取的对象数据中提取标题，无需再次请求"""
+        handler = self._title_handlers.get(id_type)
+        if handler is None:
+            return f"Unknown Object ({notion_id})"
+
+        extract, fallback = handler
+        try:
+            return extract(obj_data, notion_id)
+        except Exception:
+            return f"{fallback} ({notion_id})"
+
+    async def get_page_title(self, page_id: str, page: Optional[Dict[str, Any]] = None) -> str:
+        """Get the title of a page (reuses `page` when already retrieved)"""
+        try:
+            page = page or await self._retrieve("pages", page_id)
+        except Exception:
             return f"Untitled Page ({page_id})"
+        return self._title_from_obj(page, NotionIdType.PAGE, page_id)
 
-    async def get_database_title(self, database_id: str) -> str:
-        """Get the title of a database"""
+    async def get_database_title(self, database_id: str, db: Optional[Dict[str, Any]] = None) -> str:
+        """Get the title of a database (reuses `db` when already retrieved)"""
         try:
-            db = self.client.databases.retrieve(database_id)
-            title_parts = db.get("title", [])
-            return "".join([part.get("plain_text", "") for part in title_parts])
-        except Exception as e:
+            db = db or await self._retrieve("databases", database_id)
+        except Exception:
             return f"Untitled Database ({database_id})"
+        return self._title_from_obj(db, NotionIdType.DATABASE, database_id)
 
-    async def get_block_title(self, block_id: str) -> str:
-        """Get a representative title for a block"""
+    async def get_block_title(self, block_id: str, block: Optional[Dict[str, Any]] = None) -> str:
+        """Get a representative title for a block (reuses `block` when already retrieved)"""
         try:
-            block = self.client.blocks.retrieve(block_id)
-            block_type = block.get("type", "")
-
-            # Different block types have different title representations
-            if block_type == "heading_1" or block_type == "heading_2" or block_type == "heading_3":
-                text_parts = block.get(block_type, {}).get("rich_text", [])
-                return "".join([part.get("plain_text", "") for part in text_parts])
-            elif block_type == "paragraph":
-                text_parts = block.get("paragraph", {}).get("rich_text", [])
-                text = "".join([part.get("plain_text", "") for part in text_parts])
-                # Truncate long paragraphs
-                return text[:50] + "..." if len(text) > 50 else text
-            elif is_file_block(block):
-                return f"{block_type.capitalize()} Block"
-            else:
-                return f"{block_type.capitalize()} Block ({block_id})"
-        except Exception as e:
+            block = block or await self._retrieve("blocks", block_id)
+        except Exception:
             return f"Block ({block_id})"
+        return self._title_from_obj(block, NotionIdType.BLOCK, block_id)
 
     async def get_object_title(self, notion_id: str) -> str:
         """Get the title of any Notion object based on its ID"""
-        id_type, _ = await self.identify_id_type(notion_id)
+        # identify_id_type 已获取对象数据，直接从中提取标题，避免再次请求
+        id_type, obj_data = await self.identify_id_type(notion_id)
+        if id_type != NotionIdType.UNKNOWN and not obj_data:
+            obj_data = await self._retrieve(_RETRIEVE_KINDS[id_type], notion_id)
+        return self._title_from_obj(obj_data, id_type, notion_id)
 
-        if id_type == NotionIdType.PAGE:
-            return await self.get_page_title(notion_id)
-        elif id_type == NotionIdType.DATABASE:
-            return await self.get_database_title(notion_id)
-        elif id_type == NotionIdType.BLOCK:
-            return await self.get_block_title(notion_id)
-        else:
-            return f"Unknown Object ({notion_id})"
+    async def get_children(self, parent_id: str, id_type: NotionIdType, last_edited_time: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get all children of a parent object
 
-    async def get_children(self, parent_id: str, id_type: NotionIdType) -> List[Dict[str, Any]]:
-        """Get all children of a parent object"""
-        cache_key = f"children_{parent_id}"
-        cached_data = self._get_from_cache(cache_key)
-        if cached_data:
-            return cached_data
-
-        children = []
+        last_edited_time 为父对象当前的编辑时间；缓存过期后若编辑时间未变，
+        直接沿用上次的子项列表，无需重新分页获取
+        """
+        return (await self._get_children_entry(parent_id, id_type, last_edited_time))[1]
 
-        if id_type == NotionIdType.PAGE or id_type == NotionIdType.BLOCK:
-            # Get block children
-            has_more = True
-            start_cursor = None
+    async def _get_children_entry(self, parent_id: str, id_type: NotionIdType, last_edited_time: Optional[str] = None) -> Tuple[datetime, List[Dict[str, Any]]]:
+        """返回 (获取时间, 子项)，子项中文件 URL 的有效期从获取时间算起"""
+        parent_tag = _canonical_id(parent_id)
+        entry = await self._load_children(parent_id, id_type, last_edited_time, f"children_{parent_tag}")
 
-            while has_more:
-                response = self.client.blocks.children.list(
-                    block_id=parent_id,
-                    start_cursor=start_cursor
-                )
+        # 记录每个子项的父对象，子项失效时可以找到包含它的上级对象
+        parents = self._parents
+        for child in entry[1]:
+            child_id = child.get("id")
+            if child_id:
+                parents[_canonical_id(child_id)] = parent_tag
+        return entry
 
-                children.extend(response.get("results", []))
-                has_more = response.get("has_more", False)
-                start_cursor = response.get("next_cursor")
+    async def _load_children(self, parent_id: str, id_type: NotionIdType, last_edited_time: Optional[str], cache_key: str) -> Tuple[datetime, List[Dict[str, Any]]]:
+        """依次从缓存、编辑时间校验缓存和 Notion API 获取子项列表"""
+        cached_data = self._get_from_cache(cache_key)
+        if cached_data is not None:
+            return cached_data
 
+        # 新增或修改数据库条目不会更新数据库本身的编辑时间，不能据此判断
+        if id_type == NotionIdType.DATABASE:
+            last_edited_time = None
+
+        if last_edited_time:
+            validated = self._validated_children.get(cache_key)
+            if validated is not None and validated[0] == last_edited_time:
+                entry = validated[1:]
+                self._add_to_cache(cache_key, entry)
+                return entry
+
+        return await self._single_flight(cache_key, lambda: self._list_children(parent_id, id_type, last_edited_time, cache_key))
+
+    async def _list_children(self, parent_id: str, id_type: NotionIdType, last_edited_time: Optional[str] = None, cache_key: Optional[str] = None) -> Tuple[datetime, List[Dict[str, Any]]]:
+        """分页获取父对象的全部子项，返回 (获取时间, 子项)"""
+        # 以开始获取的时间为准，子项中的 URL 都在此之后签发
+        fetched_at = datetime.now()
+        generation = self.generation
+        children = [child async for child in self.iter_children(parent_id, id_type)]
+
+        # 编辑时间只精确到分钟：获取开始时该分钟尚未结束，之后同一分钟内的修改不会改变编辑时间，
+        # 此时的结果不能用于按编辑时间校验；获取期间发生过失效时同样不保留
+        if (last_edited_time and cache_key and generation == self.generation
+                and fetched_at >= _local_time(last_edited_time) + timedelta(minutes=1)):
+            self._validated_children[cache_key] = (last_edited_time, fetched_at, children)
+        return fetched_at, children
+
+    async def iter_children(self, parent_id: str, id_type: NotionIdType) -> AsyncIterator[Dict[str, Any]]:
+        """逐页获取父对象的子项并依次产出（不经过缓存）"""
+        if id_type == NotionIdType.PAGE or id_type == NotionIdType.BLOCK:
+            fn, id_field = self.client.blocks.children.list, "block_id"
         elif id_type == NotionIdType.DATABASE:
-            # Query database
-            has_more = True
-            start_cursor = None
-
-            while has_more:
-                response = self.client.databases.query(
-                    database_id=parent_id,
-                    start_cursor=start_cursor
-                )
-
-                children.extend(response.get("results", []))
-                has_more = response.get("has_more", False)
-                start_cursor = response.get("next_cursor")
-
-        self._add_to_cache(cache_key, children)
-        return children
-
-    async def get_all_subpages_recursive(self, parent_id: str, visited: Optional[Set[str]] = None, current_depth: int = 0, max_depth: int = 3) -> Dict[str, NotionObject]:
+            fn, id_field = self.client.databases.query, "database_id"
+        else:
+            return
+
+        def fetch(start_cursor: Optional[str]) -> asyncio.Future:
+            # 显式使用 API 允许的最大分页大小，减少往返次数
+            return asyncio.ensure_future(self._call(
+                fn,
+                **{id_field: parent_id},
+                start_cursor=start_cursor,
+                page_size=_PAGE_SIZE
+            ))
+
+        # 分页依赖上一页的游标，无法并发请求；拿到游标后立即预取下一页，
+        # 调用方处理当前页时下一页的请求已在进行
+        pending = fetch(None)
+        try:
+            while pending is not None:
+                response = await pending
+                pending = fetch(response.get("next_cursor")) if response.get("has_more", False) else None
+
+                for child in response.get("results", []):
+                    yield child
+        finally:
+            # 调用方提前结束迭代时取消未使用的预取
+            if pending is not None and not pending.done():
+                pending.cancel()
+
+    async def get_all_subpages_recursive(self, parent_id: str, max_depth: int = 3) -> Dict[str, NotionObject]:
         """
-        递归获取所有子页面，包括子页面的子页面、数据库子页面等
+        获取所有子页面，包括子页面的子页面、数据库子页面等
+
+        使用队列迭代遍历，由固定数量的工作协程并行处理节点
 
         参数:
             parent_id: 父页面 ID
-            visited: 已访问的页面 ID 集合
-            current_depth: 当前递归深度
-            max_depth: 最大递归深度，默认为 3
+            max_depth: 最大深度，默认为 3
         """
-        # 检查缓存
-        cache_key = f"subpages_{parent_id}"
-        if cache_key in self.cache:
-            # 检查缓存是否过期
-            if datetime.now() < self.cache_expiration.get(cache_key, datetime.min):
-                return self.cache[cache_key]
-
-        if visited is None:
-            visited = set()
-
-        if parent_id in visited:
-            return {}
+        # 检查缓存（不同深度的结果不同，缓存键包含深度）
+        cache_key = f"subpages_{_canonical_id(parent_id)}_{max_depth}"
+        cached_data = self._get_from_cache(cache_key)
+        if cached_data is not None:
+            return cached_data
+        generation = self.generation
+
+        result: Dict[str, NotionObject] = {}
+        visited = {parent_id}
+        # 待处理的节点: (节点 ID, 节点类型, 上级页面 ID, 深度)
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def enqueue(owner_id: str, child_nodes: List[Tuple[str, NotionIdType]], depth: int) -> None:
+            for child_id, child_type in child_nodes:
+                # 入队之前标记为已访问，避免重复处理
+                if child_id not in visited:
+                    visited.add(child_id)
+                    queue.put_nowait((child_id, child_type, owner_id, depth))
+
+        # 根节点出错则直接抛出
+        root, child_nodes = await self._get_subpage_node(parent_id, None, max_depth > 0)
+        if root is not None:
+            result[root.id] = root
+            enqueue(root.id, child_nodes, 1)
+
+        async def worker() -> None:
+            while True:
+                node_id, node_type, owner_id, depth = await queue.get()
+                try:
+                    obj, nodes = await self._get_subpage_node(node_id, owner_id, depth < max_depth, node_type)
+                    if obj is not None:
+                        # 父页面总是先于其子页面写入结果
+                        result[obj.id] = obj
+                        enqueue(obj.id, nodes, depth + 1)
+                except Exception as e:
+                    # 单个子页面出错不影响其他页面的结果
+                    logger.warning("获取子页面 %s 时出错: %s", node_id, e)
+                finally:
+                    queue.task_done()
+
+        # 固定数量的工作协程从队列取节点，慢节点不会阻塞其他分支
+        if not queue.empty():
+            workers = [asyncio.create_task(worker()) for _ in range(self._max_requests)]
+            try:
+                await queue.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
 
-        visited.add(parent_id)
-        result = {}
+        # 更新缓存
+        self._add_to_cache(cache_key, result, generation)
+        return result
 
-        # 检查是否超过最大深度
-        if current_depth > max_depth:
-            return result
+    async def _get_subpage_node(self, node_id: str, owner_id: Optional[str], with_children: bool, node_type: Optional[NotionIdType] = None) -> Tuple[Optional[NotionObject], List[Tuple[str, NotionIdType]]]:
+        """获取单个页面节点及其需要继续遍历的子页面 (ID, 类型)
 
-        # 识别父类型
-        async with self.semaphore:
-            id_type, obj_data = await self.identify_id_type(parent_id)
+        node_type 为父对象子项列表中给出的类型，已知时无需探测
+        """
+        # 识别类型
+        id_type, obj_data = await self.identify_id_type(node_id, node_type)
 
         if id_type == NotionIdType.UNKNOWN:
-            return result
-
-        # 获取父标题
-        async with self.semaphore:
-            title = await self.get_object_title(parent_id)
+            return None, []
 
-        # 将父项添加到结果中
-        parent_obj = NotionObject(
-            id=parent_id,
+        # 标题直接从 identify_id_type 返回的对象数据中提取
+        obj = NotionObject(
+            id=node_id,
             type=id_type,
-            title=title,
-            created_time=datetime.fromisoformat(obj_data.get("created_time", datetime.now().isoformat())),
-            last_edited_time=datetime.fromisoformat(obj_data.get("last_edited_time", datetime.now().isoformat())),
+            title=self._title_from_obj(obj_data, id_type, node_id),
+            parent_id=owner_id,
+            created_time=_parse_notion_time(obj_data.get("created_time")),
+            last_edited_time=_parse_notion_time(obj_data.get("last_edited_time")),
             url=obj_data.get("url", "")
         )
-        result[parent_id] = parent_obj
 
         # 如果已经到达最大深度，不再获取子项
-        if current_depth == max_depth:
-            # 更新缓存
-            self.cache[cache_key] = result
-            self.cache_expiration[cache_key] = datetime.now() + timedelta(seconds=settings.CACHE_EXPIRATION)
-            return result
+        if not with_children:
+            return obj, []
 
         # 获取子项
-        async with self.semaphore:
-            children = await self.get_children(parent_id, id_type)
-
-        # 并行处理子项，但限制数量
-        tasks = []
-        max_children = 10  # 限制子项数量以提高性能
-        count = 0
-
-        for child in children:
-            child_id = child.get("id")
-            child_type = child.get("type")
-
-            # 如果子项是页面或数据库，递归获取其子页面
-            if child_type == "child_page" or child_type == "child_database":
-                tasks.append(self.get_all_subpages_recursive(child_id, visited, current_depth + 1, max_depth))
-                count += 1
-            elif id_type == NotionIdType.DATABASE:
-                # 数据库查询结果是页面
-                tasks.append(self.get_all_subpages_recursive(child_id, visited, current_depth + 1, max_depth))
-                count += 1
-
-            if count >= max_children:
-                break
-
-        # 并行执行任务
-        if tasks:
-            child_results = await asyncio.gather(*tasks)
-            for child_result in child_results:
-                result.update(child_result)
-
-        # 更新缓存
-        self.cache[cache_key] = result
-        self.cache_expiration[cache_key] = datetime.now() + timedelta(seconds=settings.CACHE_EXPIRATION)
-
-        return result
+        children = await self.get_children(node_id, id_type, obj_data.get("last_edited_time"))
 
-    async def get_files_from_page(self, page_id: str) -> List[NotionFile]:
-        """从页面获取所有文件"""
-        files = []
-
-        # 获取页面中的所有块
-        async with self.semaphore:
-            blocks = await self.get_children(page_id, NotionIdType.PAGE)
-
-        # 并行处理块
-        tasks = []
-        for block in blocks:
-            block_id = block.get("id")
-            block_type = block.get("type")
-
-            # 检查这是否是文件块
-            if is_file_block(block):
-                tasks.append(self._extract_file_from_block(block, block_id, block_type, page_id))
-
-            # 递归检查子块
-            if block.get("has_children", False):
-                tasks.append(self.get_files_from_block(block_id))
-
-        # 并行执行任务
-        if tasks:
-            results = await asyncio.gather(*tasks)
-            for result in results:
-                if isinstance(result, list):
-                    files.extend(result)
-                elif result:  # 单个文件
-                    files.append(result)
-
-        return files
-
-    def print_file_status(self, message, is_step=False, is_success=False, is_error=False, indent=0):
-        """美化输出文件状态信息"""
-        prefix = "  " * indent
-        if is_step:
-            prefix += "\033[1;34m[FILE]\033[0m "
-        elif is_success:
-            prefix += "\033[1;32m[OK]\033[0m "
-        elif is_error:
-            prefix += "\033[1;31m[ERROR]\033[0m "
+        # 子项是页面或数据库时继续遍历；数据库查询结果本身就是页面
+        if id_type == NotionIdType.DATABASE:
+            child_nodes = [(child.get("id"), NotionIdType.PAGE) for child in children]
         else:
-            prefix += "\033[1;36m[INFO]\033[0m "
+            child_nodes = [
+                (child.get("id"), _CHILD_OBJECT_TYPES[child.get("type")])
+                for child in children if child.get("type") in _CHILD_OBJECT_TYPES
+            ]
 
-        print(f"{prefix}{message}")
+        return obj, child_nodes
 
     def _estimate_file_size(self, filename: str, file_type: str) -> int:
         """根据文件名和类型估算文件大小"""
@@ -362,81 +824,38 @@ class NotionAPI:
             # 其他文件类型
             return 1 * 1024 * 1024  # 1MB默认大小
 
-    async def _extract_file_from_block(self, block: Dict[str, Any], block_id: str, block_type: str, parent_id: str) -> Optional[NotionFile]:
-        """从块中提取文件"""
-        self.print_file_status(f"\n找到文件块: {block_id}, 类型: {block_type}", is_step=True)
+    def _extract_file_from_block(self, block: Dict[str, Any], block_id: str, block_type: str, parent_id: str, fetched_at: datetime) -> Optional[NotionFile]:
+        """从块中提取文件
+
+        fetched_at 为获取该块数据的时间；优先使用 URL 实际的过期时间，没有时从 fetched_at 起计算；
+        块未修改且 URL 与上次提取时相同（过期时间也相同）时，直接复用尚未过期的结果
+        """
+        block_content = block.get(block_type)
+        url = _extract_url(block_content)
 
-        # 尝试不同的方式提取 URL
-        url = ""
+        memo_key = (block_id, block.get("last_edited_time", ""), url)
+        cached = self._file_cache.get(memo_key)
+        if cached is not None and cached.parent_id == parent_id and cached.expiration_time > datetime.now():
+            return cached
+
+        logger.debug("找到文件块: %s, 类型: %s", block_id, block_type)
         filename = f"file_{block_id}.{block_type}"
 
-        # 方式 1: 直接从块内容中提取 URL
-        if block_type in block:
-            block_content = block[block_type]
-
-            # 检查是否有直接的 URL
-            if isinstance(block_content, dict) and "url" in block_content:
-                url = block_content["url"]
-                self.print_file_status(f"从块内容直接提取 URL", indent=1)
-
-            # 检查是否有类型字段
-            elif isinstance(block_content, dict) and "type" in block_content:
-                content_type = block_content["type"]
-                if content_type in block_content and "url" in block_content[content_type]:
-                    url = block_content[content_type]["url"]
-                    self.print_file_status(f"从内容类型提取 URL", indent=1)
-
-            # 检查是否有文件字段
-            elif isinstance(block_content, dict) and "file" in block_content:
-                if "url" in block_content["file"]:
-                    url = block_content["file"]["url"]
-                    self.print_file_status(f"从文件字段提取 URL", indent=1)
-
-            # 检查是否有外部字段
-            elif isinstance(block_content, dict) and "external" in block_content:
-                if "url" in block_content["external"]:
-                    url = block_content["external"]["url"]
-                    self.print_file_status(f"从外部字段提取 URL", indent=1)
-
-            # 检查是否有标题或名称
-            if isinstance(block_content, dict):
-                if "title" in block_content:
-                    title_parts = block_content["title"]
-                    if isinstance(title_parts, list):
-                        title = "".join([part.get("plain_text", "") for part in title_parts])
-                        if title:
-                            filename = title
-                            self.print_file_status(f"从标题提取文件名: {filename}", indent=1)
-                elif "caption" in block_content:
-                    caption_parts = block_content["caption"]
-                    if isinstance(caption_parts, list):
-                        caption = "".join([part.get("plain_text", "") for part in caption_parts])
-                        if caption:
-                            filename = caption
-                            self.print_file_status(f"从标题提取文件名: {filename}", indent=1)
-
-        # 方式 2: 传统方式提取
-        if not url:
-            file_data = block.get(block_type, {})
-            file_type = file_data.get("type", "external")
-            file_info = file_data.get(file_type, {})
-            url = file_info.get("url", "")
-            if url:
-                self.print_file_status(f"传统方式提取 URL", indent=1)
+        # 优先使用块的标题或说明作为文件名
+        if isinstance(block_content, dict):
+            title_parts = block_content.get("title")
+            if title_parts is None:
+                title_parts = block_content.get("caption")
+            title = _plain_text(title_parts)
+            if title:
+                filename = title
 
         if url:
-            # 从 URL 提取文件名
-            parsed_url = urllib.parse.urlparse(url)
-            path = parsed_url.path
-            url_filename = os.path.basename(path)
-
-            # 如果没有从块内容提取到文件名，则使用 URL 中的文件名
+            # 如果没有从块内容提取到文件名，则使用 URL 中的文件名；解码 URL 编码字符
             if filename.startswith("file_"):
-                filename = url_filename
-
-            # 解码 URL 编码字符
-            filename = decode_url_encoding(filename)
-            self.print_file_status(f"最终文件名: {filename}", indent=1, is_success=True)
+                filename = _filename_from_url(url.split("?", 1)[0])
+            else:
+                filename = decode_url_encoding(filename)
 
             # 估算文件大小
             estimated_size = self._estimate_file_size(filename, block_type)
@@ -449,208 +868,164 @@ class NotionAPI:
                 size=estimated_size,  # 使用估算的文件大小
                 url=url,
                 parent_id=parent_id,
-                expiration_time=datetime.now() + timedelta(seconds=settings.PRESIGNED_URL_EXPIRATION)
+                expiration_time=_extract_expiry(block_content) or fetched_at + timedelta(seconds=settings.PRESIGNED_URL_EXPIRATION)
             )
-            self.print_file_status(f"添加文件: {filename}", indent=1, is_success=True)
+            logger.debug("添加文件: %s", filename)
+            self._file_cache[memo_key] = file
             return file
         else:
-            self.print_file_status(f"无法提取文件 URL", indent=1, is_error=True)
+            logger.debug("无法提取文件 URL: %s", block_id)
 
         return None
 
-    async def get_files_from_block(self, block_id: str) -> List[NotionFile]:
-        """从块获取所有文件"""
-        files = []
+    async def get_all_files(self, notion_id: str, max_depth: int = 3) -> List[NotionFile]:
+        """
+        从任何 Notion 对象获取所有文件
+
+        页面、数据库和块统一通过队列遍历，每个节点只列出一次子项，
+        遍历时直接提取文件块，由固定数量的工作协程并行处理
 
-        # 获取块
-        try:
-            async with self.semaphore:
-                block = await self.async_client.blocks.retrieve(block_id)
-
-            # 检查这是否是文件块
-            block_type = block.get("type")
-            if is_file_block(block):
-                file = await self._extract_file_from_block(block, block_id, block_type, block_id)
-                if file:
-                    files.append(file)
-
-            # 获取子块
-            if block.get("has_children", False):
-                async with self.semaphore:
-                    children = await self.get_children(block_id, NotionIdType.BLOCK)
-
-                # 并行处理子块
-                tasks = []
-                for child in children:
-                    child_id = child.get("id")
-                    tasks.append(self.get_files_from_block(child_id))
-
-                # 并行执行任务
-                if tasks:
-                    results = await asyncio.gather(*tasks)
-                    for result in results:
-                        files.extend(result)
-
-        except Exception as e:
-            # 处理错误
-            print(f"Error getting files from block {block_id}: {e}")
-
-        return files
-
-    async def get_files_from_database(self, database_id: str) -> List[NotionFile]:
-        """从数据库获取所有文件"""
-        files = []
-
-        # 查询数据库以获取所有页面
-        async with self.semaphore:
-            pages = await self.get_children(database_id, NotionIdType.DATABASE)
-
-        # 并行获取每个页面的文件
-        tasks = []
-        for page in pages:
-            page_id = page.get("id")
-            tasks.append(self.get_files_from_page(page_id))
-
-        # 并行执行任务
-        if tasks:
-            results = await asyncio.gather(*tasks)
-            for result in results:
-                files.extend(result)
-
-        return files
-
-    async def get_all_files(self, notion_id: str) -> List[NotionFile]:
-        """从任何 Notion 对象获取所有文件"""
+        参数:
+            notion_id: Notion 对象 ID
+            max_depth: 子页面的最大深度，默认为 3（与文件夹结构一致）
+        """
         # 检查缓存
-        cache_key = f"files_{notion_id}"
-        if cache_key in self.cache:
-            # 检查缓存是否过期
-            if datetime.now() < self.cache_expiration.get(cache_key, datetime.min):
-                self.print_file_status(f"从缓存中获取文件: {notion_id}", is_success=True)
-                return self.cache[cache_key]
-
-        async with self.semaphore:
-            id_type, _ = await self.identify_id_type(notion_id)
+        cache_key = f"files_{_canonical_id(notion_id)}"
+        cached_files = self._get_from_cache(cache_key)
+        if cached_files is not None:
+            logger.debug("从缓存中获取文件: %s", notion_id)
+            return cached_files
+        generation = self.generation
 
-        self.print_file_status(f"开始从 {notion_id} ({id_type}) 获取文件", is_step=True)
+        id_type, obj_data = await self.identify_id_type(notion_id)
 
-        all_files = []
-        processed_ids = set()  # 跟踪已处理的 ID
+        logger.debug("开始从 %s (%s) 获取文件", notion_id, id_type)
 
-        # 获取当前对象的文件
-        if id_type == NotionIdType.PAGE:
-            files = await self.get_files_from_page(notion_id)
-            all_files.extend(files)
-        elif id_type == NotionIdType.DATABASE:
-            files = await self.get_files_from_database(notion_id)
-            all_files.extend(files)
-        elif id_type == NotionIdType.BLOCK:
-            files = await self.get_files_from_block(notion_id)
-            all_files.extend(files)
-        else:
-            self.print_file_status(f"未知的 Notion ID 类型: {id_type}", is_error=True)
+        if id_type == NotionIdType.UNKNOWN:
+            logger.warning("未知的 Notion ID 类型: %s", id_type)
             return []
 
-        processed_ids.add(notion_id)
+        all_files: List[NotionFile] = []
+
+        # 根对象本身是文件块时也需要提取；块数据可能来自缓存，按缓存最长保留时间估算获取时间
+        if id_type == NotionIdType.BLOCK and is_file_block(obj_data):
+            fetched_at = datetime.now() - timedelta(seconds=settings.CACHE_EXPIRATION)
+            file = self._extract_file_from_block(obj_data, notion_id, obj_data.get("type"), notion_id, fetched_at)
+            if file:
+                all_files.append(file)
+
+        visited = {notion_id}
+        # 待处理的节点: (节点 ID, 节点类型, 所属页面 ID, 页面深度, 编辑时间)
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def visit(node_id: str, node_type: NotionIdType, owner_id: str, depth: int, edited: Optional[str]) -> None:
+            """列出节点的子项，提取文件并将需要继续遍历的子项入队"""
+            fetched_at, children = await self._get_children_entry(node_id, node_type, edited)
+            for child in children:
+                child_id = child.get("id")
+                if not child_id or child_id in visited:
+                    continue
 
-        # 获取子页面的文件
-        try:
-            # 获取所有子页面，但限制深度以提高性能
-            notion_objects = await self.get_all_subpages_recursive(notion_id, max_depth=2)
-
-            # 并行获取每个子页面的文件，但限制数量
-            tasks = []
-            count = 0
-            max_pages = 10  # 限制子页面数量以提高性能
-
-            for obj_id, obj in notion_objects.items():
-                if obj_id != notion_id and obj_id not in processed_ids:  # 跳过当前页面和已处理的页面
-                    tasks.append(self._get_files_from_object(obj_id, obj.type))
-                    processed_ids.add(obj_id)
-                    count += 1
-                    if count >= max_pages:
-                        break
-
-            # 并行执行任务
-            if tasks:
-                results = await asyncio.gather(*tasks)
-                for result in results:
-                    all_files.extend(result)
-        except Exception as e:
-            self.print_file_status(f"获取子页面文件时出错: {e}", is_error=True)
+                # 子项列表中已包含子对象的编辑时间，用于校验其子项缓存
+                child_edited = child.get("last_edited_time")
+
+                if node_type == NotionIdType.DATABASE:
+                    # 数据库查询结果本身就是页面
+                    node = (child_id, NotionIdType.PAGE, child_id, depth + 1, child_edited)
+                else:
+                    child_type = child.get("type")
+
+                    # 检查这是否是文件块，文件归属于所在的页面
+                    if is_file_block(child):
+                        file = self._extract_file_from_block(child, child_id, child_type, owner_id, fetched_at)
+                        if file:
+                            all_files.append(file)
+
+                    if child_type == "child_page":
+                        node = (child_id, NotionIdType.PAGE, child_id, depth + 1, child_edited)
+                    elif child_type == "child_database":
+                        node = (child_id, NotionIdType.DATABASE, child_id, depth + 1, child_edited)
+                    elif child.get("has_children", False):
+                        # 普通子块仍属于当前页面，不增加深度
+                        node = (child_id, NotionIdType.BLOCK, owner_id, depth, child_edited)
+                    else:
+                        continue
+
+                if node[3] > max_depth:
+                    continue
+
+                # 入队之前标记为已访问，避免重复处理
+                visited.add(child_id)
+                queue.put_nowait(node)
+
+        async def worker() -> None:
+            while True:
+                node = await queue.get()
+                try:
+                    await visit(*node)
+                except Exception as e:
+                    # 单个节点出错不影响其他节点的结果
+                    logger.warning("获取 %s 的子项时出错: %s", node[0], e)
+                finally:
+                    queue.task_done()
+
+        # 根节点出错则直接抛出
+        if id_type != NotionIdType.BLOCK or obj_data.get("has_children", False):
+            await visit(notion_id, id_type, notion_id, 0, obj_data.get("last_edited_time"))
+
+        # 整个遍历共用固定数量的工作协程，而不是每个节点各自 gather
+        if not queue.empty():
+            workers = [asyncio.create_task(worker()) for _ in range(self._max_requests)]
+            try:
+                await queue.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
 
         # 更新缓存
-        self.cache[cache_key] = all_files
-        self.cache_expiration[cache_key] = datetime.now() + timedelta(seconds=settings.CACHE_EXPIRATION)
+        self._add_to_cache(cache_key, all_files, generation)
 
         return all_files
 
-    async def _get_files_from_object(self, obj_id: str, obj_type: NotionIdType) -> List[NotionFile]:
-        """从对象获取文件，用于并行处理"""
-        try:
-            if obj_type == NotionIdType.PAGE:
-                return await self.get_files_from_page(obj_id)
-            elif obj_type == NotionIdType.DATABASE:
-                return await self.get_files_from_database(obj_id)
-            elif obj_type == NotionIdType.BLOCK:
-                return await self.get_files_from_block(obj_id)
-            else:
-                return []
-        except Exception as e:
-            print(f"从对象 {obj_id} 获取文件时出错: {e}")
-            return []
-
     async def create_folder_structure(self, notion_id: str) -> Dict[str, NotionFolder]:
         """
         Create a folder structure based on Notion pages and subpages
         """
-        folders = {}
-
         # Get all subpages
         pages = await self.get_all_subpages_recursive(notion_id)
 
-        # Create root folder
-        root_title = pages[notion_id].title if notion_id in pages else "Root"
-        root_folder = NotionFolder(
-            id=notion_id,
-            name=root_title,
-            parent_id=None
-        )
-        folders[notion_id] = root_folder
-
-        # Create folders for each page
+        # 文件夹模型不可变，先收集每个文件夹的父文件夹和子项，再统一创建
+        folder_parents: Dict[str, str] = {}
+        children: Dict[str, List[str]] = {notion_id: []}
         for page_id, page in pages.items():
             if page_id == notion_id:
                 continue
 
-            # Try to find the parent
-            parent_id = None
-            for potential_parent_id, potential_parent in pages.items():
-                if potential_parent_id == page_id:
-                    continue
-
-                # Check if this page is a child of the potential parent
-                children = await self.get_children(potential_parent_id, potential_parent.type)
-                for child in children:
-                    if child.get("id") == page_id:
-                        parent_id = potential_parent_id
-                        break
+            # 父页面在递归获取子页面时已记录，不在结果中时归入根文件夹
+            parent_id = page.parent_id if page.parent_id in pages else notion_id
+            folder_parents[page_id] = parent_id
+            children.setdefault(page_id, [])
+            children.setdefault(parent_id, []).append(page_id)
 
-                if parent_id:
-                    break
+        # Create root folder
+        root_title = pages[notion_id].title if notion_id in pages else "Root"
+        folders = {
+            notion_id: NotionFolder(
+                id=notion_id,
+                name=root_title,
+                parent_id=None,
+                children=children[notion_id]
+            )
+        }
 
-            # Create folder
-            folder = NotionFolder(
+        # Create folders for each page
+        for page_id, parent_id in folder_parents.items():
+            folders[page_id] = NotionFolder(
                 id=page_id,
-                name=page.title,
-                parent_id=parent_id or notion_id
+                name=pages[page_id].title,
+                parent_id=parent_id,
+                children=children[page_id]
             )
-            folders[page_id] = folder
-
-            # Add to parent's children
-            if parent_id and parent_id in folders:
-                folders[parent_id].children.append(page_id)
-            elif notion_id in folders:
-                folders[notion_id].children.append(page_id)
 
         return folders
@@ -1,13 +1,46 @@
 import os
 import json
+import logging
 from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
 import urllib.parse
 import hashlib
+from bisect import bisect_left, bisect_right
+from xml.sax.saxutils import escape as xml_escape
 
 from models import NotionObject, NotionFile, NotionFolder, S3Object, S3ListObjectsResponse
 from config import settings
-from utils import generate_etag, format_datetime_for_browser, generate_s3_key, parse_s3_key
+from utils import generate_etag, format_datetime_for_browser
+
+
+# ListBucketResult 中单个 Contents 元素的模板
+CONTENTS_ROW_TMPL = (
+    "<Contents><Key>%s</Key><LastModified>%s</LastModified><ETag>%s</ETag>"
+    "<Size>%d</Size><StorageClass>%s</StorageClass>"
+    "<Owner><DisplayName>%s</DisplayName></Owner></Contents>"
+)
+
+
+def render_contents_row(obj: S3Object) -> str:
+    """将 S3 对象渲染为 Contents XML 片段"""
+    return CONTENTS_ROW_TMPL % (
+        xml_escape(obj.Key),
+        obj.LastModified.isoformat(),
+        obj.ETag,  # 由十六进制摘要生成，无需转义
+        obj.Size,
+        obj.StorageClass,
+        xml_escape(obj.Owner["DisplayName"]),
+    )
+
+
+logger = logging.getLogger(__name__)
+
+_LOG_PREFIXES = {
+    "step": "\033[1;34m[S3]\033[0m ",
+    "success": "\033[1;32m[S3_OK]\033[0m ",
+    "error": "\033[1;31m[S3_ERROR]\033[0m ",
+    "info": "\033[1;36m[S3_INFO]\033[0m ",
+}
 
 
 class S3Adapter:
@@ -15,43 +48,56 @@ class S3Adapter:
         self.presigned_url_expiration = settings.PRESIGNED_URL_EXPIRATION
 
         # 内存存储对象
-        self.objects: Dict[str, Dict[str, Any]] = {}
+        self.objects: Dict[str, S3Object] = {}  # S3 对象不可变，直接保存模型实例
         self.folders: Dict[str, Dict[str, Any]] = {}
-        self.files: Dict[str, Dict[str, Any]] = {}
+        self.files: Dict[str, NotionFile] = {}  # 直接保存不可变的模型实例
+
+        # 预先渲染的 Contents XML 片段: key -> XML
+        self.content_rows: Dict[str, str] = {}
 
-        # 缓存
-        self.cache = {}
+        # 按字典序排列的对象键及对应的 S3 对象，前缀查询时二分定位
+        self.sorted_keys: List[str] = []
+        self.sorted_objects: List[S3Object] = []
+
+        # 文件键 -> 文件 ID，按键查找文件时无需遍历
+        self.key_to_file_id: Dict[str, str] = {}
+
+        # 缓存: (操作, 参数...) -> 结果
+        self.cache: Dict[Tuple, Any] = {}
+
+    def log(self, message, *args, is_step=False, is_success=False, is_error=False, indent=0, level=logging.DEBUG):
+        """输出日志（通过 logging 输出，参数延迟格式化，未启用的级别直接返回）"""
+        if not logger.isEnabledFor(level):
+            return
 
-    def log(self, message, is_step=False, is_success=False, is_error=False, indent=0):
-        """输出日志"""
         prefix = "  " * indent
         if is_step:
-            prefix += "\033[1;34m[S3]\033[0m "
+            prefix += _LOG_PREFIXES["step"]
         elif is_success:
-            prefix += "\033[1;32m[S3_OK]\033[0m "
+            prefix += _LOG_PREFIXES["success"]
         elif is_error:
-            prefix += "\033[1;31m[S3_ERROR]\033[0m "
+            prefix += _LOG_PREFIXES["error"]
         else:
-            prefix += "\033[1;36m[S3_INFO]\033[0m "
+            prefix += _LOG_PREFIXES["info"]
 
-        print(f"{prefix}{message}")
+        logger.log(level, prefix + message, *args)
 
-        # 缓存
-        self.cache = {}
+    def _get_s3_object_from_notion_file(self, file: NotionFile, prefix: str = "", now: Optional[datetime] = None) -> S3Object:
+        """Convert a NotionFile to an S3Object
 
-    def _get_s3_object_from_notion_file(self, file: NotionFile, prefix: str = "") -> S3Object:
-        """Convert a NotionFile to an S3Object"""
+        now 为本次更新统一使用的修改时间，为空时使用当前时间
+        """
         # 使用文件名而不是ID
         if prefix:
             key = f"{prefix}{file.name}"
         else:
             key = file.name
 
-        self.log(f"创建文件: {key}", indent=1)
+        self.log("创建文件: %s", key, indent=1)
 
         return S3Object(
             Key=key,
-            LastModified=datetime.now(),
+            LastModified=now or datetime.now(),
             ETag=f'"{generate_etag(file.id)}"',
             Size=file.size or 0,
             StorageClass="STANDARD",
@@ -63,26 +109,29 @@ class S3Adapter:
         if folder_id not in self.folders:
             return ""
 
-        folder = NotionFolder(**self.folders[folder_id])
-        path = ""
-
-        # 如果文件夹名称有效，使用它
-        if folder.name.strip() and not folder.name.startswith(folder.id[:8]):
-            path = folder.name
-        else:
-            # 使用默认名称
-            path = "Notion_Files"
+        # 自下而上收集各级文件夹名称，最后一次性拼接
+        parts = []
+        seen = set()
+        folders = self.folders
+        while folder_id in folders and folder_id not in seen:
+            seen.add(folder_id)
+            folder = folders[folder_id]
+            name = folder["name"]
+
+            # 如果文件夹名称有效，使用它，否则使用默认名称
+            if name.strip() and not name.startswith(folder["id"][:8]):
+                parts.append(name)
+            else:
+                parts.append("Notion_Files")
 
-        # 如果有父文件夹，递归获取父文件夹路径
-        if folder.parent_id and folder.parent_id in self.folders:
-            parent_path = self._get_folder_path(folder.parent_id)
-            if parent_path:
-                return f"{parent_path}/{path}"
+            folder_id = folder.get("parent_id")
 
-        return path
+        return "/".join(reversed(parts))
 
-    def _get_s3_object_from_notion_folder(self, folder: NotionFolder) -> S3Object:
+    def _get_s3_object_from_notion_folder(self, folder: NotionFolder, now: Optional[datetime] = None) -> S3Object:
         """Convert a NotionFolder to an S3Object (as a directory)"""
+        now = now or datetime.now()
+
         # 获取完整路径
         path = ""
 
@@ -98,10 +147,10 @@ class S3Adapter:
             parent_path = self._get_folder_path(folder.parent_id)
             if parent_path:
                 key = f"{parent_path}/{path}/"
-                self.log(f"创建文件夹: {key}", indent=1)
+                self.log("创建文件夹: %s", key, indent=1)
                 return S3Object(
                     Key=key,
-                    LastModified=datetime.now(),
+                    LastModified=now,
                     ETag=f'"{generate_etag(folder.id)}"',
                     Size=0,  # Directories have size 0
                     StorageClass="STANDARD",
@@ -110,17 +159,36 @@ class S3Adapter:
 
         # 没有父文件夹，直接使用文件夹名称
         key = f"{path}/"
-        self.log(f"创建文件夹: {key}", indent=1)
+        self.log("创建文件夹: %s", key, indent=1)
 
         return S3Object(
             Key=key,
-            LastModified=datetime.now(),
+            LastModified=now,
             ETag=f'"{generate_etag(folder.id)}"',
             Size=0,  # Directories have size 0
             StorageClass="STANDARD",
             Owner={"DisplayName": "notion-s3-api"}
         )
 
+    def _build_folder_full_paths(self) -> None:
+        """为每个文件夹预先计算完整路径（以 / 结尾），存入 full_path 字段"""
+        def resolve(folder_id: str, visiting: set) -> str:
+            folder = self.folders[folder_id]
+            if "full_path" in folder:
+                return folder["full_path"]
+
+            parent_path = ""
+            parent_id = folder.get("parent_id")
+            visiting.add(folder_id)
+            if parent_id and parent_id in self.folders and parent_id not in visiting:
+                parent_path = resolve(parent_id, visiting)
+
+            folder["full_path"] = f"{parent_path}{folder['name']}/"
+            return folder["full_path"]
+
+        for folder_id in self.folders:
+            resolve(folder_id, set())
+
     async def update_from_notion_data(
         self,
         notion_objects: Dict[str, NotionObject],
@@ -135,175 +203,134 @@ class S3Adapter:
         self.objects = {}
         self.folders = {}
         self.files = {}
+        self.content_rows = {}
+        self.sorted_keys = []
+        self.sorted_objects = []
+        self.key_to_file_id = {}
         self.cache = {}  # 清除缓存
 
         # 添加对象
-        self.log(f"添加 {len(notion_objects)} 个 Notion 对象", is_step=True)
+        self.log("添加 %s 个 Notion 对象", len(notion_objects), is_step=True)
         # 不再将对象ID直接添加到objects字典中
         # for obj_id, obj in notion_objects.items():
         #     self.objects[obj_id] = obj.dict()
 
         # 添加文件夹
-        self.log(f"添加 {len(notion_folders)} 个文件夹", is_step=True)
+        self.log("添加 %s 个文件夹", len(notion_folders), is_step=True)
         for folder_id, folder in notion_folders.items():
             # 使用model_dump而不是dict
             self.folders[folder_id] = folder.model_dump()
 
+        # 预先计算每个文件夹的完整路径
+        self._build_folder_full_paths()
+
         # 先添加所有文件夹到self.folders，然后再创建S3对象
         # 这样可以确保在创建S3对象时能够正确构建文件夹路径
         for folder_id, folder in notion_folders.items():
-            folder_obj = NotionFolder(**self.folders[folder_id])
             # 为文件夹创建 S3 对象
-            s3_obj = self._get_s3_object_from_notion_folder(folder_obj)
+            s3_obj = self._get_s3_object_from_notion_folder(folder, start_time)
             key = s3_obj.Key
 
             if key not in self.objects:
-                # 使用model_dump而不是dict
-                self.objects[key] = s3_obj.model_dump()
+                self.objects[key] = s3_obj
 
-        # 添加文件
-        self.log(f"添加 {len(notion_files)} 个文件", is_step=True)
-        for i, file in enumerate(notion_files):
-            if i % 10 == 0 and i > 0:
-                self.log(f"已处理 {i}/{len(notion_files)} 个文件", indent=1)
+        # 每个文件夹的文件键前缀只计算一次，同一文件夹下的文件共用
+        folder_prefixes = {}
+        for folder_id in self.folders:
+            folder_path = self._get_folder_path(folder_id)
+            # 如果没有找到有效的文件夹路径，使用默认名称
+            folder_prefixes[folder_id] = folder_path + "/" if folder_path else "Notion_Files/"
 
+        # 添加文件
+        self.log("添加 %s 个文件", len(notion_files), is_step=True)
+        for file in notion_files:
             file_id = file.id
-            # 使用model_dump而不是dict
-            self.files[file_id] = file.model_dump()
-
-            # 找到父文件夹
-            parent_id = file.parent_id
-            prefix = ""
-
-            if parent_id in self.folders:
-                # 获取完整的文件夹路径
-                folder_path = self._get_folder_path(parent_id)
-                if folder_path:
-                    prefix = folder_path + "/"
-                    self.log(f"文件使用文件夹前缀: {prefix}", indent=2)
-                else:
-                    # 如果没有找到有效的文件夹路径，使用默认名称
-                    prefix = "Notion_Files/"
-                    self.log(f"文件使用默认文件夹前缀: {prefix}", indent=2)
+            self.files[file_id] = file
+
+            # 找到父文件夹的键前缀
+            prefix = folder_prefixes.get(file.parent_id, "")
 
             # 为文件创建 S3 对象
-            s3_obj = self._get_s3_object_from_notion_file(file, prefix)
+            s3_obj = self._get_s3_object_from_notion_file(file, prefix, start_time)
             key = s3_obj.Key
 
+            # 同名文件以最先出现的为准
+            self.key_to_file_id.setdefault(key, file_id)
+
             if key not in self.objects:
-                # 使用model_dump而不是dict
-                self.objects[key] = s3_obj.model_dump()
+                self.objects[key] = s3_obj
+
+        # 对象在下次更新前不会变化，预先渲染列表 XML 片段，列表时直接复用
+        self.content_rows = {key: render_contents_row(obj) for key, obj in self.objects.items()}
+        self.sorted_keys = sorted(self.objects)
+        self.sorted_objects = [self.objects[key] for key in self.sorted_keys]
 
         end_time = datetime.now()
         duration = (end_time - start_time).total_seconds()
-        self.log(f"S3 适配器更新完成，耗时 {duration:.2f} 秒", is_success=True)
+        self.log("S3 适配器更新完成，耗时 %.2f 秒", duration, is_success=True, level=logging.INFO)
 
     async def list_objects(self, bucket_name: str, prefix: str = "", delimiter: str = "", max_keys: int = 1000) -> S3ListObjectsResponse:
         """列出 S3 存储桶中的对象"""
-        self.log(f"\n列出存储桶 {bucket_name} 中的对象，前缀: {prefix}", is_step=True)
+        self.log("\n列出存储桶 %s 中的对象，前缀: %s", bucket_name, prefix, is_step=True)
         start_time = datetime.now()
 
         # 使用缓存提高性能
-        cache_key = f"list_objects_{bucket_name}_{prefix}_{delimiter}_{max_keys}"
+        cache_key = ("list_objects", bucket_name, prefix, delimiter, max_keys)
         if cache_key in self.cache:
-            self.log(f"使用缓存结果", is_success=True)
+            self.log("使用缓存结果", is_success=True)
             return self.cache[cache_key]
 
         contents = []
+        keys = self.sorted_keys
+        objects = self.sorted_objects
+        limit = max_keys if max_keys > 0 else None
 
-        # 按前缀过滤对象
-        filtered_objects = {
-            key: obj for key, obj in self.objects.items()
-            if key.startswith(prefix)
-        }
+        # 键已排序，匹配前缀的键是连续的一段：二分定位起点，遇到第一个不匹配的键即停止
+        i = bisect_left(keys, prefix) if prefix else 0
+        end = len(keys)
+        prefix_len = len(prefix)
 
-        self.log(f"找到 {len(filtered_objects)} 个匹配前缀 '{prefix}' 的对象", indent=1)
-
-        # 处理分隔符（用于目录式列表）
         if delimiter:
-            self.log(f"使用分隔符: '{delimiter}'", indent=1)
-            # 按公共前缀分组
-            common_prefixes = set()
-            filtered_keys = []
-
-            for key in filtered_objects.keys():
-                if key.startswith(prefix):
-                    suffix = key[len(prefix):]
-                    delimiter_pos = suffix.find(delimiter)
-
-                    if delimiter_pos >= 0:
-                        # This is a common prefix
-                        common_prefix = prefix + suffix[:delimiter_pos + 1]
-                        common_prefixes.add(common_prefix)
-                    else:
-                        # This is a direct child
-                        filtered_keys.append(key)
-
-            self.log(f"找到 {len(common_prefixes)} 个公共前缀和 {len(filtered_keys)} 个直接子项", indent=1)
-
-            # 添加公共前缀作为目录对象
-            for common_prefix in common_prefixes:
-                s3_obj = S3Object(
-                    Key=common_prefix,
-                    LastModified=datetime.now(),
-                    ETag=f'"{generate_etag(common_prefix)}"',
-                    Size=0,
-                    StorageClass="STANDARD",
-                    Owner={"DisplayName": "notion-s3-api"}
-                )
-                contents.append(s3_obj)
-
-            # Add direct children
-            for key in filtered_keys:
-                obj = filtered_objects[key]
-                # 检查对象是否有所需的 S3 字段
-                if isinstance(obj, dict) and "Key" in obj and "LastModified" in obj and "ETag" in obj and "Size" in obj:
-                    # 已经是 S3 格式
-                    s3_obj = S3Object(**obj)
-                else:
-                    # 需要转换为 S3 格式
-                    self.log(f"将对象转换为 S3 格式: {key}", indent=2)
-                    s3_obj = S3Object(
-                        Key=key,
-                        LastModified=datetime.now(),
-                        ETag=f'"{generate_etag(key)}"',
-                        Size=obj.get("size", 0) if isinstance(obj, dict) else 0,
+            self.log("使用分隔符: '%s'", delimiter, indent=1)
+            # 同一公共前缀下的键也是连续的，记录公共前缀后直接跳过整组
+            while i < end and (limit is None or len(contents) < limit):
+                key = keys[i]
+                if not key.startswith(prefix):
+                    break
+
+                delimiter_pos = key.find(delimiter, prefix_len)
+                if delimiter_pos >= 0:
+                    # This is a common prefix
+                    common_prefix = key[:delimiter_pos + len(delimiter)]
+                    contents.append(S3Object(
+                        Key=common_prefix,
+                        LastModified=start_time,
+                        ETag=f'"{generate_etag(common_prefix)}"',
+                        Size=0,
                         StorageClass="STANDARD",
                         Owner={"DisplayName": "notion-s3-api"}
-                    )
-                contents.append(s3_obj)
-        else:
-            # 没有分隔符，直接列出所有带前缀的对象
-            self.log(f"列出所有带前缀的对象", indent=1)
-            for key, obj in filtered_objects.items():
-                # 检查对象是否有所需的 S3 字段
-                if isinstance(obj, dict) and "Key" in obj and "LastModified" in obj and "ETag" in obj and "Size" in obj:
-                    # 已经是 S3 格式
-                    s3_obj = S3Object(**obj)
+                    ))
+                    i = bisect_right(keys, common_prefix + "\U0010ffff", i)
                 else:
-                    # 需要转换为 S3 格式
-                    self.log(f"将对象转换为 S3 格式: {key}", indent=2)
-                    s3_obj = S3Object(
-                        Key=key,
-                        LastModified=datetime.now(),
-                        ETag=f'"{generate_etag(key)}"',
-                        Size=obj.get("size", 0) if isinstance(obj, dict) else 0,
-                        StorageClass="STANDARD",
-                        Owner={"DisplayName": "notion-s3-api"}
-                    )
-                contents.append(s3_obj)
-
-        # 按键排序
-        contents.sort(key=lambda x: x.Key)
-        self.log(f"排序后的对象数量: {len(contents)}", indent=1)
-
-        # 应用 max_keys
-        if max_keys > 0 and len(contents) > max_keys:
-            contents = contents[:max_keys]
-            is_truncated = True
-            self.log(f"应用 max_keys={max_keys}，结果被截断", indent=1)
+                    # This is a direct child
+                    contents.append(objects[i])
+                    i += 1
         else:
-            is_truncated = False
+            # 没有分隔符，直接列出所有带前缀的对象
+            self.log("列出所有带前缀的对象", indent=1)
+            while i < end and (limit is None or len(contents) < limit):
+                key = keys[i]
+                if not key.startswith(prefix):
+                    break
+                contents.append(objects[i])
+                i += 1
+
+        self.log("找到 %s 个匹配前缀 '%s' 的条目", len(contents), prefix, indent=1)
+
+        # 达到 max_keys 后即停止遍历；若下一个键仍匹配前缀，说明结果被截断
+        is_truncated = i < end and keys[i].startswith(prefix)
+        if is_truncated:
+            self.log("应用 max_keys=%s，结果被截断", max_keys, indent=1)
 
         response = S3ListObjectsResponse(
             Name=bucket_name,
@@ -320,147 +347,89 @@ class S3Adapter:
 
         end_time = datetime.now()
         duration = (end_time - start_time).total_seconds()
-        self.log(f"S3 列表操作完成，耗时 {duration:.2f} 秒", is_success=True)
+        self.log("S3 列表操作完成，耗时 %.2f 秒", duration, is_success=True)
 
         return response
 
     async def get_object(self, key: str) -> Optional[Dict[str, Any]]:
         """从 S3 存储桶获取对象"""
-        self.log(f"\n获取对象: {key}", is_step=True)
+        self.log("\n获取对象: %s", key, is_step=True)
         start_time = datetime.now()
 
         # 使用缓存提高性能
-        cache_key = f"get_object_{key}"
+        cache_key = ("get_object", key)
         if cache_key in self.cache:
-            self.log(f"使用缓存结果", is_success=True)
+            self.log("使用缓存结果", is_success=True)
             return self.cache[cache_key]
 
         if key in self.objects:
-            self.log(f"在对象字典中找到对象", is_success=True)
-            self.cache[cache_key] = self.objects[key]
-            return self.objects[key]
+            self.log("在对象字典中找到对象", is_success=True)
+            # 只有被请求的对象才转换为字典
+            result = self.objects[key].model_dump()
+            self.cache[cache_key] = result
+            return result
 
         # 检查这是否是文件
-        self.log(f"在文件列表中搜索对象", indent=1)
-        for file_id, file in self.files.items():
-            file_obj = NotionFile(**file)
-
-            # 找到父文件夹
-            parent_id = file_obj.parent_id
-            prefix = ""
-
-            if parent_id in self.folders:
-                # 获取完整的文件夹路径
-                folder_path = self._get_folder_path(parent_id)
-                if folder_path:
-                    prefix = folder_path + "/"
-                else:
-                    # 如果没有找到有效的文件夹路径，使用默认名称
-                    prefix = "Notion_Files/"
-
-            # 使用文件名而不是ID
-            if prefix:
-                file_key = f"{prefix}{file_obj.name}"
-            else:
-                file_key = file_obj.name
-
-            if file_key == key:
-                self.log(f"找到文件: {file_obj.name}", is_success=True)
-                result = {
-                    "Body": None,  # 我们不存储实际的文件内容
-                    "ContentType": "application/octet-stream",
-                    "ContentLength": file_obj.size or 0,
-                    "ETag": f'"{generate_etag(file_id)}"',
-                    "LastModified": datetime.now(),
-                    "Metadata": {
-                        "notion_id": file_id,
-                        "notion_url": file_obj.url
-                    }
+        file_obj = self._find_file(key)
+        if file_obj is not None:
+            self.log("找到文件: %s", file_obj.name, is_success=True)
+            result = {
+                "Body": None,  # 我们不存储实际的文件内容
+                "ContentType": "application/octet-stream",
+                "ContentLength": file_obj.size or 0,
+                "ETag": f'"{generate_etag(file_obj.id)}"',
+                "LastModified": datetime.now(),
+                "Metadata": {
+                    "notion_id": file_obj.id,
+                    "notion_url": file_obj.url
                 }
-                self.cache[cache_key] = result
+            }
+            self.cache[cache_key] = result
 
-                end_time = datetime.now()
-                duration = (end_time - start_time).total_seconds()
-                self.log(f"S3 获取对象操作完成，耗时 {duration:.2f} 秒", is_success=True)
-                return result
+            end_time = datetime.now()
+            duration = (end_time - start_time).total_seconds()
+            self.log("S3 获取对象操作完成，耗时 %.2f 秒", duration, is_success=True)
+            return result
 
-        self.log(f"未找到对象: {key}", is_error=True)
+        self.log("未找到对象: %s", key, is_error=True)
         return None
 
     async def generate_presigned_url(self, key: str) -> Optional[str]:
         """为对象生成预签名 URL"""
-        self.log(f"\n生成预签名 URL: {key}", is_step=True)
+        self.log("\n生成预签名 URL: %s", key, is_step=True)
         start_time = datetime.now()
 
         # 使用缓存提高性能
-        cache_key = f"presigned_url_{key}"
+        cache_key = ("presigned_url", key)
         if cache_key in self.cache:
-            self.log(f"使用缓存的 URL", is_success=True)
+            self.log("使用缓存的 URL", is_success=True)
             return self.cache[cache_key]
 
         # 找到文件
-        self.log(f"在文件列表中搜索对象", indent=1)
-        for file_id, file in self.files.items():
-            file_obj = NotionFile(**file)
-
-            # 找到父文件夹
-            parent_id = file_obj.parent_id
-            prefix = ""
-
-            if parent_id in self.folders:
-                # 获取完整的文件夹路径
-                folder_path = self._get_folder_path(parent_id)
-                if folder_path:
-                    prefix = folder_path + "/"
-                else:
-                    # 如果没有找到有效的文件夹路径，使用默认名称
-                    prefix = "Notion_Files/"
+        file_obj = self._find_file(key)
+        if file_obj is not None:
+            self.log("找到文件: %s", file_obj.name, is_success=True)
+            self.cache[cache_key] = file_obj.url
 
-            # 使用文件名而不是ID
-            if prefix:
-                file_key = f"{prefix}{file_obj.name}"
-            else:
-                file_key = file_obj.name
+            end_time = datetime.now()
+            duration = (end_time - start_time).total_seconds()
+            self.log("S3 生成预签名 URL 操作完成，耗时 %.2f 秒", duration, is_success=True)
+            return file_obj.url
 
-            if file_key == key:
-                self.log(f"找到文件: {file_obj.name}", is_success=True)
-                self.cache[cache_key] = file_obj.url
-
-                end_time = datetime.now()
-                duration = (end_time - start_time).total_seconds()
-                self.log(f"S3 生成预签名 URL 操作完成，耗时 {duration:.2f} 秒", is_success=True)
-                return file_obj.url
-
-        self.log(f"未找到对象: {key}", is_error=True)
+        self.log("未找到对象: %s", key, is_error=True)
         return None
 
     def get_expiration_time(self, key: str) -> Optional[datetime]:
         """Get the expiration time for a presigned URL"""
         # Find the file
-        for file_id, file in self.files.items():
-            file_obj = NotionFile(**file)
-
-            # Find parent folder
-            parent_id = file_obj.parent_id
-            prefix = ""
-
-            if parent_id in self.folders:
-                # 获取完整的文件夹路径
-                folder_path = self._get_folder_path(parent_id)
-                if folder_path:
-                    prefix = folder_path + "/"
-                else:
-                    # 如果没有找到有效的文件夹路径，使用默认名称
-                    prefix = "Notion_Files/"
-
-            # 使用文件名而不是ID
-            if prefix:
-                file_key = f"{prefix}{file_obj.name}"
-            else:
-                file_key = file_obj.name
-
-            if file_key == key:
-                # Return the expiration time
-                return file_obj.expiration_time or (datetime.now() + timedelta(seconds=self.presigned_url_expiration))
+        file_obj = self._find_file(key)
+        if file_obj is not None:
+            # Return the expiration time
+            return file_obj.expiration_time or (datetime.now() + timedelta(seconds=self.presigned_url_expiration))
 
         return None
+
+    def _find_file(self, key: str) -> Optional[NotionFile]:
+        """按对象键查找文件"""
+        file_id = self.key_to_file_id.get(key)
+        return self.files.get(file_id) if file_id is not None else None
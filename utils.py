@@ -1,12 +1,16 @@
+import logging
 import re
 import urllib.parse
 import uuid
 from datetime import datetime, timezone
 import hashlib
+from functools import lru_cache
 from typing import Dict, Any, Optional, Tuple
 
 from models import NotionIdType
 
+logger = logging.getLogger(__name__)
+
 
 def decode_url_encoding(text: str) -> str:
     """
@@ -19,52 +23,79 @@ def decode_url_encoding(text: str) -> str:
         return text
 
 
+@lru_cache(maxsize=1 << 16)
 def generate_etag(content: str) -> str:
     """
     为内容生成 ETag
+
+    输入多为重复出现的文件 ID、文件夹 ID 和键，因此缓存结果；
+    ETag 只作为不透明标识，使用比 md5 更快的 blake2b（16 字节摘要，长度与 md5 相同）
     """
-    return hashlib.md5(content.encode()).hexdigest()
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
 
 
+@lru_cache(maxsize=1024)
 def format_datetime_for_browser(dt: datetime) -> str:
     """
     格式化日期时间以便在浏览器中以本地时区显示
+
+    同一批文件的过期时间通常相同，因此缓存格式化结果
     """
+    # 已是 UTC 时间时无需转换
+    if dt.tzinfo is timezone.utc:
+        return dt.isoformat()
     # 转换为带时区信息的 ISO 格式
     return dt.astimezone(timezone.utc).isoformat()
 
 
-def detect_notion_id_type(notion_id: str) -> Tuple[NotionIdType, str]:
-    """
-    检测 Notion ID 的类型（页面、块、数据库）
-    并规范化 ID 格式
+# Notion ID: 32 位十六进制，可带 8-4-4-4-12 格式的破折号
+_NOTION_ID_RE = re.compile(r'[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}')
+
+
+@lru_cache(maxsize=4096)
+def _normalize_notion_id(raw: str) -> Tuple[Optional[str], int]:
     """
-    # 处理可能的 URL
-    if notion_id.startswith("http"):
-        # 从 URL 中提取 ID
-        parts = notion_id.split("/")
-        for part in parts:
-            if len(part.replace("-", "")) >= 32:
-                notion_id = part
-                break
-        print(f"从 URL 提取的 ID: {notion_id}")
+    将 ID 规范化为 Notion API 使用的带破折号格式
 
+    返回 (规范化的 ID, 去掉破折号后的长度)，ID 太短时规范化的 ID 为 None；
+    结果只取决于输入字符串，因此缓存以避免重复切片和格式化
+    """
     # 移除 ID 中的任何破折号
-    normalized_id = notion_id.replace("-", "")
+    normalized_id = raw.replace("-", "")
+    length = len(normalized_id)
 
     # 如果 ID 太短，则无效
-    if len(normalized_id) < 32:
-        print(f"警告: ID 太短 ({len(normalized_id)} < 32)")
-        return NotionIdType.UNKNOWN, notion_id
+    if length < 32:
+        return None, length
 
     # 如果 ID 太长，截取前 32 个字符
-    if len(normalized_id) > 32:
-        print(f"警告: ID 太长 ({len(normalized_id)} > 32)，截取前 32 个字符")
-        normalized_id = normalized_id[:32]
+    normalized_id = normalized_id[:32]
 
     # 确保 ID 以正确的格式用于 Notion API（带破折号）
-    formatted_id = f"{normalized_id[:8]}-{normalized_id[8:12]}-{normalized_id[12:16]}-{normalized_id[16:20]}-{normalized_id[20:]}"
-    print(f"格式化后的 ID: {formatted_id}")
+    return f"{normalized_id[:8]}-{normalized_id[8:12]}-{normalized_id[12:16]}-{normalized_id[16:20]}-{normalized_id[20:]}", length
+
+
+def detect_notion_id_type(notion_id: str) -> Tuple[NotionIdType, str]:
+    """
+    检测 Notion ID 的类型（页面、块、数据库）
+    并规范化 ID 格式
+
+    规范化结果由 _normalize_notion_id 缓存，这里不缓存，每次调用都会记录无效 ID 的警告
+    """
+    # 处理可能的 URL
+    if notion_id.startswith("http"):
+        # 从 URL 中提取 ID（页面 URL 的路径通常为 "标题-ID"，直接匹配 ID 部分）
+        match = _NOTION_ID_RE.search(notion_id)
+        if match:
+            notion_id = match.group(0)
+        logger.debug("从 URL 提取的 ID: %s", notion_id)
+
+    formatted_id, length = _normalize_notion_id(notion_id)
+    if formatted_id is None:
+        logger.warning("ID 太短 (%s < 32): %s", length, notion_id)
+        return NotionIdType.UNKNOWN, notion_id
+    if length > 32:
+        logger.warning("ID 太长 (%s > 32)，截取前 32 个字符: %s", length, notion_id)
 
     # 我们需要进行 API 调用来确定确切类型
     # 现在，返回 UNKNOWN 并让调用者确定类型
@@ -98,57 +129,50 @@ def parse_s3_key(key: str) -> Dict[str, str]:
     return result
 
 
+# 支持提取的文件块类型，模块加载时构建一次，成员判断为哈希查找
+FILE_BLOCK_TYPES = frozenset((
+    # 基本文件类型
+    "file", "pdf",
+    # 图片类型
+    "image",
+    # 多媒体类型
+    "video", "audio",
+    # 其他媒体类型
+    "media", "file_attachment", "document", "spreadsheet", "presentation",
+
+    # 以下类型已注释，不再支持提取
+    # # 嵌入类型
+    # "embed", "bookmark", "link_preview", "link_to_page",
+    # # 代码和数据类型
+    # "code", "equation",
+    # # 其他可能包含文件的块
+    # "callout", "synced_block", "template", "column_list", "column",
+    # # 数据库相关
+    # "child_database", "child_page", "table", "table_row",
+    # # 外部服务集成
+    # "external", "drive", "figma", "framer", "gist", "maps", "miro", "typeform", "codepen",
+    # # 其他可能的块类型
+    # "divider", "table_of_contents", "breadcrumb", "bulleted_list_item", "numbered_list_item"
+))
+
+# 块内容中表示文件的字段
+_FILE_CONTENT_KEYS = ("url", "file", "external")
+
+
 def is_file_block(block: Dict[str, Any]) -> bool:
     """
     检查块是否表示文件
     """
-    # 扩展支持的文件类型
-    file_block_types = [
-        # 基本文件类型
-        "file", "pdf",
-        # 图片类型
-        "image",
-        # 多媒体类型
-        "video", "audio",
-        # 其他媒体类型
-        "media", "file_attachment", "document", "spreadsheet", "presentation"
-
-        # 以下类型已注释，不再支持提取
-        # # 嵌入类型
-        # "embed", "bookmark", "link_preview", "link_to_page",
-        # # 代码和数据类型
-        # "code", "equation",
-        # # 其他可能包含文件的块
-        # "callout", "synced_block", "template", "column_list", "column",
-        # # 数据库相关
-        # "child_database", "child_page", "table", "table_row",
-        # # 外部服务集成
-        # "external", "drive", "figma", "framer", "gist", "maps", "miro", "typeform", "codepen",
-        # # 其他可能的块类型
-        # "divider", "table_of_contents", "breadcrumb", "bulleted_list_item", "numbered_list_item"
-    ]
-
     block_type = block.get("type")
 
     # 检查基本类型
-    if block_type in file_block_types:
+    if block_type in FILE_BLOCK_TYPES:
         return True
 
-    # 检查块是否有文件 URL
-    if block_type and block_type in block:
-        block_content = block[block_type]
-
-        # 检查是否有 URL 属性
-        if isinstance(block_content, dict) and "url" in block_content:
-            return True
-
-        # 检查是否有文件属性
-        if isinstance(block_content, dict) and "file" in block_content:
-            return True
-
-        # 检查是否有外部文件属性
-        if isinstance(block_content, dict) and "external" in block_content:
-            return True
+    # 检查块是否有文件 URL、文件或外部文件属性
+    block_content = block.get(block_type) if block_type else None
+    if isinstance(block_content, dict):
+        return any(key in block_content for key in _FILE_CONTENT_KEYS)
 
     return False
 